@@ -0,0 +1,159 @@
+"""
+Compare the database-per-tenant and shared-collection storage layouts.
+
+For every layout and tenant count, synthetic tenants are provisioned through
+MongoDataService (indexes, info, users, mails), then random point lookups
+are timed and the server is asked how many collections, indexes and open
+WiredTiger files it ends up with. Everything is removed afterwards.
+
+Usage (needs a MongoDB at MONGODB_URL, ideally a throwaway one):
+    python -m benchmarks.storage_layout_bench
+    python -m benchmarks.storage_layout_bench --tenants 1000 --users 10 --mails 50
+
+Results are printed and written as JSON to benchmarks/results/.
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import time
+from datetime import datetime
+
+from common.constants import Collection
+from services.dataService import MongoDataService
+from services.storageLayout import DatabasePerTenantLayout, SharedCollectionLayout
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+BENCH_PREFIX = "bench_"
+BENCH_SHARED_DB = "bench_shared"
+
+
+class _BenchDatabaseLayout(DatabasePerTenantLayout):
+    """only sees the synthetic tenants, never real ones"""
+
+    def list_tenants(self, client):
+        return [name for name in client.list_database_names() if name.startswith(BENCH_PREFIX)]
+
+
+def _percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def _server_stats(service):
+    client = service.client
+    db_names = [
+        name
+        for name in client.list_database_names()
+        if name.startswith(BENCH_PREFIX) or name == BENCH_SHARED_DB
+    ]
+    collections = indexes = storage_bytes = 0
+    for name in db_names:
+        stats = client[name].command("dbStats")
+        collections += stats.get("collections", 0)
+        indexes += stats.get("indexes", 0)
+        storage_bytes += stats.get("storageSize", 0) + stats.get("indexSize", 0)
+
+    server_status = client.admin.command("serverStatus")
+    wired_tiger = server_status.get("wiredTiger", {})
+    return {
+        "databases": len(db_names),
+        "collections": collections,
+        "indexes": indexes,
+        "storage_bytes": storage_bytes,
+        "wt_open_files": wired_tiger.get("connection", {}).get("files currently open"),
+        "wt_cache_bytes": wired_tiger.get("cache", {}).get("bytes currently in the cache"),
+    }
+
+
+def run(layout, tenant_count, users, mails, lookups):
+    service = MongoDataService(layout=layout)
+    tenants = [f"{BENCH_PREFIX}{i:06d}" for i in range(tenant_count)]
+
+    started = time.perf_counter()
+    for tenant_id in tenants:
+        service.ensure_indexes(tenant_id)
+        service.create_one(tenant_id, Collection.INFO, {"_id": "singleton", "cid": "c", "csecret": "s"})
+        service.create_many(
+            tenant_id,
+            Collection.USER,
+            [{"id": f"user-{u}", "display_name": f"User {u}"} for u in range(users)],
+        )
+        service.create_many(
+            tenant_id,
+            Collection.MAIL,
+            [
+                {
+                    "message_id": f"msg-{u}-{m}",
+                    "user_id": f"user-{u}",
+                    "subject": f"subject {m}",
+                    "attachments": None,
+                    "is_deleted": False,
+                }
+                for u in range(users)
+                for m in range(mails)
+            ],
+        )
+    provision_seconds = time.perf_counter() - started
+
+    latencies = []
+    for _ in range(lookups):
+        tenant_id = random.choice(tenants)
+        user = random.randrange(users)
+        query = {"user_id": f"user-{user}", "message_id": f"msg-{user}-{random.randrange(mails)}"}
+        t0 = time.perf_counter()
+        service.read(tenant_id, Collection.MAIL, query, limit=1)
+        latencies.append((time.perf_counter() - t0) * 1000)
+
+    result = {
+        "layout": layout.name,
+        "tenants": tenant_count,
+        "users_per_tenant": users,
+        "mails_per_user": mails,
+        "provision_seconds": round(provision_seconds, 3),
+        "lookup_ms": {
+            "p50": round(_percentile(latencies, 50), 3),
+            "p99": round(_percentile(latencies, 99), 3),
+            "mean": round(statistics.mean(latencies), 3),
+        },
+        "server": _server_stats(service),
+    }
+
+    for tenant_id in tenants:
+        service.delete_database(tenant_id)
+    service.client.drop_database(BENCH_SHARED_DB)
+    service.close()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark storage layouts")
+    parser.add_argument("--tenants", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--layouts", nargs="+", default=["database", "shared"], choices=["database", "shared"])
+    parser.add_argument("--users", type=int, default=5)
+    parser.add_argument("--mails", type=int, default=20)
+    parser.add_argument("--lookups", type=int, default=2000)
+    args = parser.parse_args()
+
+    layouts = {
+        "database": _BenchDatabaseLayout,
+        "shared": lambda: SharedCollectionLayout(db_name=BENCH_SHARED_DB),
+    }
+    results = []
+    for tenant_count in args.tenants:
+        for name in args.layouts:
+            result = run(layouts[name](), tenant_count, args.users, args.mails, args.lookups)
+            print(json.dumps(result))
+            results.append(result)
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f"storage_layout_{datetime.now():%Y%m%d_%H%M%S}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"results written to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,382 @@
+"""
+Benchmark the mail sync paths and the read endpoints end to end.
+
+Synthetic tenants are served by a local Microsoft Graph stand-in (a real
+GraphServiceClient over an in-process httpx transport, so the SDK parsing is
+part of the measurement) and stored in MongoDB, or in mongomock with
+`--mongo memory`. For every tenant the stages run in order:
+
+    getMail        full sync of every mailbox
+    getLatestMail  delta sync, `--changed` and `--removed` messages per mailbox
+    delMail        `--deletes` deletions per tenant
+    read           list users, list a user's mails, search, EML download
+
+and each stage reports messages/s, p50/p99 latency (per message for the
+sync stages, per call otherwise), peak RSS so far and the Graph requests and
+Mongo operations it made. Synthetic tenants are removed afterwards.
+
+Usage (with MongoDB at MONGODB_URL, ideally a throwaway one):
+    python -m benchmarks.sync_bench
+    python -m benchmarks.sync_bench --tenants 5 --mailboxes 20 --messages 100
+    python -m benchmarks.sync_bench --mongo memory --graph-latency-ms 20
+
+`--mongo memory` needs `pip install mongomock`. Results are printed and
+written as JSON to benchmarks/results/.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import resource
+import statistics
+import sys
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+from urllib.parse import parse_qs
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+DELTA_PAGE_SIZE = 50
+READ_REQUESTS = 200
+
+
+def _use_memory_mongo(mongo_calls: Counter) -> None:
+    """replace pymongo.MongoClient by one shared mongomock client, before services are imported"""
+    import mongomock
+    import mongomock.gridfs
+    import pymongo
+
+    mongomock.gridfs.enable_gridfs_integration()
+    shared = mongomock.MongoClient()
+
+    def client(*args, **kwargs):
+        return shared
+
+    pymongo.MongoClient = client
+
+    def bulk_write(self, requests, ordered=True, **kwargs):
+        # mongomock does not accept the operations of recent pymongo versions
+        modified = upserted = 0
+        for op in requests:
+            result = self.update_one(op._filter, op._doc, upsert=op._upsert)
+            modified += result.modified_count
+            upserted += result.upserted_id is not None
+        return type("BulkWriteResult", (), {"modified_count": modified, "upserted_count": upserted})()
+
+    mongomock.Collection.bulk_write = bulk_write
+
+    # mongomock emits no command events, count collection calls instead
+    for name in (
+        "find", "find_one", "insert_one", "insert_many", "update_one", "update_many",
+        "delete_one", "delete_many", "aggregate", "bulk_write", "count_documents",
+        "find_one_and_update", "create_index",
+    ):
+        method = getattr(mongomock.Collection, name)
+
+        def counted(self, *args, __method=method, __name=name, **kwargs):
+            mongo_calls[__name] += 1
+            return __method(self, *args, **kwargs)
+
+        setattr(mongomock.Collection, name, counted)
+
+
+class GraphStandIn:
+    """answers the Graph requests of the sync paths for one synthetic tenant"""
+
+    def __init__(self, tenant_id, mailboxes, messages, eml_bytes, latency, calls: Counter):
+        self.tenant_id = tenant_id
+        self.users = [f"user-{i:05d}" for i in range(mailboxes)]
+        self.messages = messages
+        self.eml_bytes = eml_bytes
+        self.latency = latency
+        self.calls = calls
+        # message id -> version, bumped by the delta round
+        self.versions = {}
+        self.round = 0
+        self.changed = 0
+        self.removed = 0
+
+    def message_ids(self, user_id):
+        return [f"{user_id}-msg-{m:06d}" for m in range(self.messages)]
+
+    def _message(self, message_id):
+        version = self.versions.get(message_id, 0)
+        return {
+            "id": message_id,
+            "subject": f"subject {message_id} v{version}",
+            "internetMessageId": f"<{message_id}@bench.local>",
+            "from": {"emailAddress": {"address": f"sender{hash(message_id) % 97}@bench.local"}},
+            "receivedDateTime": "2025-01-01T00:00:00Z",
+            "attachments": [],
+        }
+
+    def _eml(self, message_id):
+        header = (
+            f"Message-ID: <{message_id}@bench.local>\r\nSubject: {message_id} "
+            f"v{self.versions.get(message_id, 0)}\r\n\r\n"
+        ).encode()
+        return header + b"x" * max(0, self.eml_bytes - len(header))
+
+    def _delta(self, user_id, query):
+        base = f"https://graph.microsoft.com/v1.0/users/{user_id}/mailFolders/inbox/messages/delta"
+        if "$deltatoken" in query:
+            ids = self.message_ids(user_id)
+            changed = [self._message(mid) for mid in ids[: self.changed]]
+            removed = [
+                {"id": mid, "@removed": {"reason": "deleted"}}
+                for mid in ids[self.changed : self.changed + self.removed]
+            ]
+            return {"value": changed + removed, "@odata.deltaLink": f"{base}?$deltatoken=r{self.round}"}
+
+        skip = int(query.get("$skiptoken", ["0"])[0])
+        ids = self.message_ids(user_id)[skip : skip + DELTA_PAGE_SIZE]
+        body = {"value": [self._message(mid) for mid in ids]}
+        if skip + DELTA_PAGE_SIZE < self.messages:
+            body["@odata.nextLink"] = f"{base}?$skiptoken={skip + DELTA_PAGE_SIZE}"
+        else:
+            body["@odata.deltaLink"] = f"{base}?$deltatoken=r{self.round}"
+        return body
+
+    async def handle(self, request):
+        import httpx
+        from services.metricsService import _graph_endpoint
+
+        self.calls[f"{request.method} {_graph_endpoint(request.url.path)}"] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        segments = request.url.path.split("/")[2:]  # without "" and "v1.0"
+        query = parse_qs(request.url.query.decode())
+        if segments == ["users"]:
+            return httpx.Response(200, json={"value": [{"id": u, "displayName": u} for u in self.users]})
+        if segments[-1].startswith("delta"):
+            return httpx.Response(200, json=self._delta(segments[1], query))
+        if segments[-1] == "$value":
+            return httpx.Response(200, content=self._eml(segments[3]))
+        if request.method == "DELETE":
+            return httpx.Response(204)
+        return httpx.Response(404, json={"error": {"code": "NotFound", "message": request.url.path}})
+
+    def client(self):
+        import httpx
+        from kiota_abstractions.authentication import AnonymousAuthenticationProvider
+        from msgraph import GraphRequestAdapter, GraphServiceClient
+
+        http_client = httpx.AsyncClient(transport=httpx.MockTransport(self.handle))
+        return GraphServiceClient(request_adapter=GraphRequestAdapter(AnonymousAuthenticationProvider(), http_client))
+
+
+def _percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def _peak_rss_mb():
+    # ru_maxrss is in KB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _mongo_command_counts(metrics):
+    counts = Counter()
+    for family in metrics.registry.collect():
+        if family.name == "mongo_command_seconds":
+            for sample in family.samples:
+                if sample.name.endswith("_count"):
+                    counts[sample.labels["command"]] += int(sample.value)
+    return counts
+
+
+class Stage:
+    def __init__(self, name, graph_calls, mongo_counts):
+        self.name = name
+        self.graph_calls = graph_calls
+        self.mongo_counts = mongo_counts
+        self.latencies = []
+        self.messages = 0
+
+    def __enter__(self):
+        self.graph_before = Counter(self.graph_calls)
+        self.mongo_before = self.mongo_counts()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self.started
+        self.graph = dict(Counter(self.graph_calls) - self.graph_before)
+        self.mongo = dict(self.mongo_counts() - self.mongo_before)
+
+    def result(self):
+        latencies = self.latencies or [0.0]
+        return {
+            "stage": self.name,
+            "seconds": round(self.seconds, 3),
+            "messages": self.messages,
+            "messages_per_sec": round(self.messages / self.seconds, 1) if self.messages and self.seconds else None,
+            "calls_per_sec": round(len(self.latencies) / self.seconds, 1) if self.seconds else None,
+            "latency_ms": {
+                "samples": len(self.latencies),
+                "p50": round(_percentile(latencies, 50), 3),
+                "p99": round(_percentile(latencies, 99), 3),
+                "mean": round(statistics.mean(latencies), 3),
+            },
+            "peak_rss_mb": _peak_rss_mb(),
+            "graph_requests": sum(self.graph.values()),
+            "graph_requests_by_endpoint": self.graph,
+            "mongo_ops": sum(self.mongo.values()),
+            "mongo_ops_by_command": self.mongo,
+        }
+
+
+async def run(args):
+    mongo_calls = Counter()
+    if args.mongo == "memory":
+        _use_memory_mongo(mongo_calls)
+
+    import httpx
+    import services.mailService as mail_service
+    from services.metricsService import metrics
+    from services.tenantService import TenantService
+    from main import app
+
+    def mongo_counts():
+        if args.mongo == "memory":
+            return Counter(mongo_calls)
+        return _mongo_command_counts(metrics)
+
+    # per-message latency of the sync stages
+    process_mail = mail_service._process_mail
+    current = {}
+
+    async def timed_process_mail(*a, **kw):
+        t0 = time.perf_counter()
+        try:
+            return await process_mail(*a, **kw)
+        finally:
+            current["stage"].latencies.append((time.perf_counter() - t0) * 1000)
+            current["stage"].messages += 1
+
+    mail_service._process_mail = timed_process_mail
+
+    graph_calls = Counter()
+    tenants = []
+    for _ in range(args.tenants):
+        tenant_id = str(uuid.uuid4())
+        standin = GraphStandIn(
+            tenant_id, args.mailboxes, args.messages, args.eml_kb * 1024, args.graph_latency_ms / 1000, graph_calls
+        )
+        tenant_service = TenantService(tenant_id)
+        tenant_service.createTenant("bench-client", "bench-secret")
+        tenant_service.insertUserList([{"id": user, "display_name": user} for user in standin.users])
+        tenants.append((tenant_id, standin, standin.client()))
+
+    stages = []
+    try:
+        with Stage("getMail", graph_calls, mongo_counts) as stage:
+            current["stage"] = stage
+            for tenant_id, _, client in tenants:
+                await mail_service.getMail(client, tenant_id)
+        stages.append(stage)
+
+        for _, standin, _ in tenants:
+            standin.round += 1
+            standin.changed = min(args.changed, args.messages)
+            standin.removed = min(args.removed, args.messages - standin.changed)
+            for user in standin.users:
+                for message_id in standin.message_ids(user)[: standin.changed]:
+                    standin.versions[message_id] = standin.round
+        with Stage("getLatestMail", graph_calls, mongo_counts) as stage:
+            current["stage"] = stage
+            for tenant_id, _, client in tenants:
+                await mail_service.getLatestMail(client, tenant_id)
+        stages.append(stage)
+
+        with Stage("delMail", graph_calls, mongo_counts) as stage:
+            for tenant_id, standin, client in tenants:
+                user = standin.users[0]
+                first = standin.changed + standin.removed
+                for message_id in standin.message_ids(user)[first : first + args.deletes]:
+                    t0 = time.perf_counter()
+                    await mail_service.delMail(client, tenant_id, user, message_id)
+                    stage.latencies.append((time.perf_counter() - t0) * 1000)
+                    stage.messages += 1
+        stages.append(stage)
+
+        with Stage("read", graph_calls, mongo_counts) as stage:
+            # messages from here on were neither removed by the delta round nor deleted by delMail
+            untouched = args.changed + args.removed + args.deletes
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as api:
+                for i in range(READ_REQUESTS):
+                    tenant_id, standin, _ = tenants[i % len(tenants)]
+                    user = standin.users[i % len(standin.users)]
+                    message_id = standin.message_ids(user)[untouched + i % (args.messages - untouched)]
+                    path = [
+                        f"/tenant/{tenant_id}/users",
+                        f"/tenant/{tenant_id}/users/{user}/mails",
+                        f"/tenant/{tenant_id}/mails/search?user_id={user}&limit=50",
+                        f"/tenant/{tenant_id}/users/{user}/mails/{message_id}/eml",
+                    ][i % 4]
+                    t0 = time.perf_counter()
+                    response = await api.get(path)
+                    stage.latencies.append((time.perf_counter() - t0) * 1000)
+                    if response.status_code >= 400:
+                        raise RuntimeError(f"GET {path}: {response.status_code} {response.text[:200]}")
+        stages.append(stage)
+    finally:
+        mail_service._process_mail = process_mail
+        if not args.keep:
+            for tenant_id, _, _ in tenants:
+                TenantService(tenant_id).delete()
+
+    return {
+        "benchmark": "sync",
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "config": {
+            "mongo": args.mongo,
+            "tenants": args.tenants,
+            "mailboxes": args.mailboxes,
+            "messages": args.messages,
+            "eml_kb": args.eml_kb,
+            "changed": args.changed,
+            "removed": args.removed,
+            "deletes": args.deletes,
+            "graph_latency_ms": args.graph_latency_ms,
+        },
+        "stages": [stage.result() for stage in stages],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark mail sync and read paths")
+    parser.add_argument("--mongo", choices=["server", "memory"], default="server")
+    parser.add_argument("--tenants", type=int, default=2)
+    parser.add_argument("--mailboxes", type=int, default=10, help="per tenant")
+    parser.add_argument("--messages", type=int, default=50, help="per mailbox")
+    parser.add_argument("--eml-kb", type=int, default=20)
+    parser.add_argument("--changed", type=int, default=5, help="changed messages per mailbox in the delta round")
+    parser.add_argument("--removed", type=int, default=2, help="removed messages per mailbox in the delta round")
+    parser.add_argument("--deletes", type=int, default=10, help="delMail calls per tenant")
+    parser.add_argument("--graph-latency-ms", type=float, default=0, help="added to every Graph request")
+    parser.add_argument("--keep", action="store_true", help="keep the synthetic tenants")
+    args = parser.parse_args()
+    if args.messages <= args.changed + args.removed + args.deletes:
+        # the read stage downloads EMLs the other stages left in place
+        parser.error("--messages must exceed --changed + --removed + --deletes")
+
+    result = asyncio.run(run(args))
+    for stage in result["stages"]:
+        summary = {key: value for key, value in stage.items() if not key.endswith(("_by_endpoint", "_by_command"))}
+        print(json.dumps(summary))
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f"sync_{datetime.now():%Y%m%d_%H%M%S}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+    print(f"results written to {path}")
+
+
+if __name__ == "__main__":
+    main()
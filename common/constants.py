@@ -3,11 +3,23 @@ import os
 
 @unique
 class LogLevel(IntEnum):
-    INFO = 1
-    ERROR = 2
+    """ordered by severity, records below the configured LOG_LEVEL are skipped"""
+    DEBUG = 10
+    INFO = 20
+    WARNING = 30
+    ERROR = 40
 @unique
 class Collection(str, Enum):
     INFO = 'info'
     USER = 'users'
     MAIL = 'mails'
-    ATT = 'attachments'
\ No newline at end of file
+    ATT = 'attachments'
+    FS_FILES = 'fs.files'
+    FS_CHUNKS = 'fs.chunks'
+
+
+@unique
+class ReadRoute(str, Enum):
+    """where a read is served: the primary, or a secondary within the staleness bound"""
+    PRIMARY = 'primary'
+    SECONDARY = 'secondary'
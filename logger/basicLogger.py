@@ -1,25 +1,169 @@
+import atexit
 import datetime
+import json
 import os
+import queue
+import sys
+import threading
+import time
 from common.constants import LogLevel
 
+# records waiting to be written, further records are dropped and counted
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_BATCH_SIZE = 500
+LOG_FLUSH_SECONDS = 0.5
+# longest wait of flush() (and so of interpreter exit) for queued records
+LOG_FLUSH_TIMEOUT_SECONDS = 5.0
+# "json": one object per line, "text": [time] [pid] [LEVEL] [operation] msg (k=v)
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+# keys of every JSON record, a field with one of these names is written as field_<name>
+RESERVED_KEYS = frozenset({"ts", "level", "pid", "operation", "msg"})
+
+
+class _LogWriter:
+    """background thread appending queued lines to one file, batch by batch"""
+
+    def __init__(self, log_file):
+        self.log_file = log_file
+        self.queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._pid = None
+        self._thread = None
+
+    def _ensure_started(self):
+        # a forked worker process does not inherit the thread
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self.queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+            self._thread = threading.Thread(target=self._run, name=f"log-writer:{self.log_file}", daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def put(self, record):
+        self._ensure_started()
+        if not self._thread.is_alive():
+            self.dropped += 1
+            return
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def _drain(self, first):
+        batch = [first]
+        while len(batch) < LOG_BATCH_SIZE:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        f = None
+        while True:
+            try:
+                first = self.queue.get(timeout=LOG_FLUSH_SECONDS)
+            except queue.Empty:
+                continue
+            batch = self._drain(first)
+            dropped = 0
+            try:
+                lines = [_format(*record) for record in batch]
+                if self.dropped:
+                    dropped, self.dropped = self.dropped, 0
+                    msg = f"dropped {dropped} log records, queue full or write failed"
+                    lines.append(_format(datetime.datetime.now(), os.getpid(), "WARNING", "Logger", msg, None))
+                if f is None:
+                    f = open(self.log_file, "a", encoding="utf-8", buffering=1 << 16)
+                f.write("".join(lines))
+                f.flush()
+            except Exception as e:
+                # the batch is lost, the file is reopened for the next one
+                self.dropped += dropped + len(batch)
+                print(f"log writer {self.log_file}: {e!r}", file=sys.stderr)
+                if f is not None:
+                    try:
+                        f.close()
+                    except Exception:
+                        pass
+                    f = None
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    def flush(self, timeout=LOG_FLUSH_TIMEOUT_SECONDS):
+        """wait until every queued record is written, at most `timeout` seconds"""
+        if self._pid != os.getpid():
+            return
+        deadline = time.monotonic() + timeout
+        while self.queue.unfinished_tasks and self._thread.is_alive():
+            if time.monotonic() >= deadline:
+                return
+            time.sleep(0.01)
+
+
+def _format(timestamp, pid, level, operation, msg, fields):
+    if LOG_FORMAT == "text":
+        line = f"[{timestamp.strftime('%Y-%m-%d %H:%M:%S')}] [{pid}] [{level}]"
+        if operation:
+            line += f" [{operation}]"
+        line += f" {msg}"
+        if fields:
+            line += " (" + ", ".join(f"{k}={v}" for k, v in fields.items()) + ")"
+        return line + "\n"
+
+    record = {"ts": timestamp.isoformat(timespec="milliseconds"), "level": level, "pid": pid}
+    if operation:
+        record["operation"] = operation
+    record["msg"] = msg
+    for key, value in (fields or {}).items():
+        record[f"field_{key}" if key in RESERVED_KEYS else key] = value
+    return json.dumps(record, ensure_ascii=False, default=str) + "\n"
+
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def _get_writer(log_file):
+    with _writers_lock:
+        if log_file not in _writers:
+            _writers[log_file] = _LogWriter(log_file)
+        return _writers[log_file]
+
+
+@atexit.register
+def _flush_all():
+    for writer in list(_writers.values()):
+        writer.flush()
+
 
 class BasicLogger:
     LEVEL_MAP = {
+        LogLevel.DEBUG: "DEBUG",
         LogLevel.INFO: "INFO",
         LogLevel.ERROR: "ERROR",
+        LogLevel.WARNING: "WARNING",
     }
 
     def __init__(self, log_file=None):
         self.log_file = log_file
         self.pid = os.getpid()
+        self._writer = _get_writer(os.path.abspath(log_file)) if log_file else None
 
-    def _write(self, level, msg):
-        timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        line = f"[{timestamp}] [{self.pid}] [{level}] {msg}"
-        if self.log_file:
-            with open(self.log_file, "a", encoding="utf-8") as f:
-                f.write(line + "\n")
+    def _write(self, level, msg, operation=None, fields=None):
+        # formatted and written by the writer thread, never on the caller's thread
+        if self._writer:
+            self._writer.put((datetime.datetime.now(), os.getpid(), level, operation, msg, fields))
 
-    def log(self, log_level, msg):
+    def log(self, log_level, msg, operation=None, fields=None):
         level = self.LEVEL_MAP.get(log_level, f"UNKNOWN({log_level})")
-        self._write(level, msg)
+        self._write(level, msg, operation, fields)
+
+    def flush(self):
+        if self._writer:
+            self._writer.flush()
@@ -1,21 +1,70 @@
+import os
+import time
+
+from common.constants import LogLevel
 from logger.basicLogger import BasicLogger
 
+# records below this level are dropped before any formatting
+LOG_LEVEL = LogLevel[os.getenv("LOG_LEVEL", "INFO").upper()]
+# per (operation, msg): the first LOG_SAMPLE_BURST DEBUG/INFO records of every
+# LOG_SAMPLE_WINDOW_SECONDS are kept, then one in LOG_SAMPLE_EVERY; 1 disables sampling
+LOG_SAMPLE_BURST = int(os.getenv("LOG_SAMPLE_BURST", "20"))
+LOG_SAMPLE_EVERY = int(os.getenv("LOG_SAMPLE_EVERY", "100"))
+LOG_SAMPLE_WINDOW_SECONDS = 1.0
+MAX_SAMPLE_KEYS = 10000
+
+
+class _Sampler:
+    """thins out repetitive records, counts are approximate under concurrency"""
+
+    def __init__(self, burst, every, window):
+        self.burst = burst
+        self.every = every
+        self.window = window
+        self._counters = {}
+
+    def sample(self, key):
+        """None to drop the record, else the number of records dropped since the last kept one"""
+        now = time.monotonic()
+        counter = self._counters.get(key)
+        if counter is None or now - counter[0] >= self.window:
+            if len(self._counters) >= MAX_SAMPLE_KEYS:
+                self._counters.clear()
+            skipped = counter[2] if counter else 0
+            self._counters[key] = [now, 1, 0]
+            return skipped
+        counter[1] += 1
+        if counter[1] <= self.burst or counter[1] % self.every == 0:
+            skipped, counter[2] = counter[2], 0
+            return skipped
+        counter[2] += 1
+        return None
+
 
 class OperationLogger:
-    def __init__(self, log_file='operation.log'):
+    def __init__(self, log_file='operation.log', level=None):
         self.BasicLogger = BasicLogger(log_file = log_file)
+        self.level = LOG_LEVEL if level is None else level
+        self._sampler = _Sampler(LOG_SAMPLE_BURST, LOG_SAMPLE_EVERY, LOG_SAMPLE_WINDOW_SECONDS)
 
     def log(self, log_level, operation, msg, **kwargs):
         """ 支援彈性參數，讓所有操作類型都能塞入自己要的欄位
             ex.
                 logger = OperationLogger()
-                logger.log(LogLevel.ERROR, 'deleteMail', 'timeout', user='mail789')
-                => [2025-06-26 16:56:01] [12345] [ERROR] [deleteMail] timeout (user=mail789)"""
-        details = ''
-        if kwargs:
-            details = '(' + ', '.join(f'{k}={v}' for k, v in kwargs.items()) + ')'
-        msg = (
-            f"[{operation}] {msg} {details}"
-        ).strip()
-        
-        self.BasicLogger.log(log_level, msg)
\ No newline at end of file
+                logger.log(LogLevel.ERROR, 'deleteMail', 'timeout', user_id='mail789')
+                => {"ts": "2025-06-26T16:56:01.123", "level": "ERROR", "pid": 12345,
+                    "operation": "deleteMail", "msg": "timeout", "user_id": "mail789"}
+            DEBUG and INFO records are sampled per (operation, msg), a kept record
+            carries `sampled_out`, the number of records dropped before it.
+            Keep `msg` constant and pass the variable parts as fields: they are
+            only formatted when the record is written, and the sampling key stays stable."""
+        if log_level < self.level:
+            return
+        if log_level < LogLevel.WARNING and LOG_SAMPLE_EVERY > 1:
+            skipped = self._sampler.sample((operation, msg))
+            if skipped is None:
+                return
+            if skipped:
+                kwargs["sampled_out"] = skipped
+
+        self.BasicLogger.log(log_level, msg, operation=operation, fields=kwargs)
@@ -1,21 +1,29 @@
+import time
 import uvicorn
-from fastapi import FastAPI, Request, status
+from fastapi import FastAPI, Request, Response, status
 from fastapi.responses import JSONResponse
 from services.routerService import router as tenant_router
-from services.routerService import sync_data_cron
+from services.routerService import sync_data_cron, sweep_orphan_emls_cron, retention_cron
+from services.routerService import sync_heartbeat_cron, lease_manager
+from services.leaseService import LEASE_HEARTBEAT_SECONDS
 from contextlib import asynccontextmanager
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 
 from services.dataService import DataService
 from services.logService import setup_logger
+from services.metricsService import metrics
 
 
 data_service = None
 logger = setup_logger(__name__)
 
 scheduler = AsyncIOScheduler()
-scheduler.add_job(sync_data_cron, 'interval', minutes=5)
-scheduler.start()
+# tenants still syncing are handled by the tenant scheduler, the job itself never overlaps
+scheduler.add_job(sync_data_cron, 'interval', minutes=5, max_instances=1, coalesce=True)
+scheduler.add_job(sweep_orphan_emls_cron, 'interval', hours=1)
+scheduler.add_job(retention_cron, 'cron', hour=3)
+if lease_manager is not None:
+    scheduler.add_job(sync_heartbeat_cron, 'interval', seconds=LEASE_HEARTBEAT_SECONDS)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -23,9 +31,13 @@ async def lifespan(app: FastAPI):
     global data_service
     logger.info("Initializing data service...")
     data_service = DataService().get_data_service()
+    # started with the app, not at import time
+    scheduler.start()
     logger.info("Application startup complete")
     yield
     scheduler.shutdown()
+    if lease_manager is not None:
+        lease_manager.shutdown()
     logger.info("Application is shutting down...")
 
 app = FastAPI(
@@ -44,10 +56,30 @@ async def generic_exception_handler(request: Request, exc: Exception):
     )
 
 
+@app.middleware("http")
+async def observe_request(request: Request, call_next):
+    """request latency by route template, unmatched paths are not recorded"""
+    started = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    if route is not None:
+        metrics.http_seconds.labels(request.method, route.path, str(response.status_code)).observe(
+            time.perf_counter() - started
+        )
+    return response
+
+
 # Include the router with all our endpoints
 app.include_router(tenant_router)
 
 
+@app.get("/metrics", tags=["Health Check"], include_in_schema=False)
+def get_metrics():
+    """Prometheus metrics."""
+    body, content_type = metrics.exposition()
+    return Response(content=body, media_type=content_type)
+
+
 @app.get("/", tags=["Health Check"])
 def read_root():
     """Root endpoint for health checks."""
@@ -0,0 +1,64 @@
+"""
+Show which replica set member serves each read route.
+
+Usage (against a replica set, see docker-compose.replset.yaml):
+    python -m scripts.check_read_routing
+
+Writes a probe document to a scratch tenant, reads it back through
+ReadRoute.PRIMARY and ReadRoute.SECONDARY and prints the member that
+answered every find, then drops the scratch tenant.
+"""
+
+from pymongo import monitoring
+
+from common.constants import ReadRoute
+
+PROBE_TENANT = "read_routing_check"
+PROBE_COLLECTION = "probe"
+READS_PER_ROUTE = 5
+
+
+class _FindListener(monitoring.CommandListener):
+    def __init__(self):
+        self.servers = []
+
+    def started(self, event):
+        if event.command_name == "find":
+            self.servers.append(event.connection_id)
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+def main():
+    listener = _FindListener()
+    monitoring.register(listener)
+
+    # imported after registering, the listener only sees clients created later
+    from services.dataService import MongoDataService
+
+    service = MongoDataService()
+    primary = service.client.primary
+    print(f"primary: {primary}, secondaries: {sorted(service.client.secondaries)}")
+
+    service.create_one(PROBE_TENANT, PROBE_COLLECTION, {"probe": True})
+    try:
+        for route in (ReadRoute.PRIMARY, ReadRoute.SECONDARY):
+            listener.servers.clear()
+            for _ in range(READS_PER_ROUTE):
+                service.read(PROBE_TENANT, PROBE_COLLECTION, {}, route=route)
+            served = ", ".join(
+                f"{host}:{port}{' (primary)' if (host, port) == primary else ''}"
+                for host, port in listener.servers
+            )
+            print(f"{route.value:>9}: {served}")
+    finally:
+        service.delete_database(PROBE_TENANT)
+        service.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Copy tenants between storage layouts (see services/storageLayout.py).
+
+Usage:
+    python -m scripts.migrate_storage_layout --from database --to shared
+    python -m scripts.migrate_storage_layout --from shared --to database --tenant <encrypted tenant id>
+
+Documents keep their `_id`, so `eml_file_id` references stay valid and an
+interrupted run can simply be started again: already copied documents are
+skipped. The source data is only removed with --drop-source, after the
+copied counts of a tenant match.
+"""
+
+import argparse
+from itertools import islice
+
+from pymongo.errors import BulkWriteError
+
+from common.constants import Collection, LogLevel
+from logger.operationLogger import OperationLogger
+from services.dataService import MongoDataService
+from services.storageLayout import get_storage_layout
+
+DUPLICATE_KEY_ERROR = 11000
+# chunks are copied together with their file, by files_id
+COPY_COLLECTIONS = [
+    Collection.INFO,
+    Collection.USER,
+    Collection.MAIL,
+    Collection.ATT,
+    Collection.FS_FILES,
+]
+
+logger = OperationLogger()
+
+
+def _batches(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def _insert_missing(collection, documents):
+    """insert documents, skipping the ones already copied by a previous run"""
+    if not documents:
+        return 0
+    try:
+        return len(collection.insert_many(documents, ordered=False).inserted_ids)
+    except BulkWriteError as e:
+        errors = e.details.get("writeErrors", [])
+        if any(error["code"] != DUPLICATE_KEY_ERROR for error in errors):
+            raise
+        return e.details.get("nInserted", 0)
+
+
+def migrate_tenant(client, source, target, tenant_id, batch_size):
+    """copy one tenant, returns {collection: (source count, copied count)}"""
+    source_db = source.database(client, tenant_id)
+    target_db = target.database(client, tenant_id)
+    counts = {}
+
+    for collection_type in COPY_COLLECTIONS:
+        query = source.scope_query(tenant_id, collection_type, {})
+        total = source_db[collection_type].count_documents(query)
+        copied = 0
+        cursor = source_db[collection_type].find(query, batch_size=batch_size)
+        for batch in _batches(cursor, batch_size):
+            documents = [
+                target.scope_document(
+                    tenant_id,
+                    collection_type,
+                    source.unscope_document(tenant_id, collection_type, doc),
+                )
+                for doc in batch
+            ]
+            copied += _insert_missing(target_db[collection_type], documents)
+
+            if collection_type == Collection.FS_FILES:
+                file_ids = [doc["_id"] for doc in batch]
+                chunks = source_db[Collection.FS_CHUNKS].find(
+                    {"files_id": {"$in": file_ids}}, batch_size=batch_size
+                )
+                for chunk_batch in _batches(chunks, batch_size):
+                    _insert_missing(target_db[Collection.FS_CHUNKS], chunk_batch)
+
+        counts[collection_type.value] = (total, copied)
+
+    return counts
+
+
+def _is_complete(client, source, target, tenant_id):
+    """compare per-collection document counts of a tenant in both layouts"""
+    for collection_type in COPY_COLLECTIONS:
+        source_count = source.database(client, tenant_id)[collection_type].count_documents(
+            source.scope_query(tenant_id, collection_type, {})
+        )
+        target_count = target.database(client, tenant_id)[collection_type].count_documents(
+            target.scope_query(tenant_id, collection_type, {})
+        )
+        if source_count != target_count:
+            return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate tenants between storage layouts")
+    parser.add_argument("--from", dest="source", required=True, choices=["database", "shared"])
+    parser.add_argument("--to", dest="target", required=True, choices=["database", "shared"])
+    parser.add_argument("--tenant", action="append", help="encrypted tenant ID, repeatable, default all")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--drop-source", action="store_true", help="remove source data once a tenant is verified")
+    args = parser.parse_args()
+
+    if args.source == args.target:
+        parser.error("--from and --to must differ")
+
+    source = get_storage_layout(args.source)
+    target_service = MongoDataService(layout=get_storage_layout(args.target))
+    target = target_service.layout
+    client = target_service.client
+
+    tenants = args.tenant or source.list_tenants(client)
+    for tenant_id in tenants:
+        target_service.ensure_indexes(tenant_id)
+        counts = migrate_tenant(client, source, target, tenant_id, args.batch_size)
+        complete = _is_complete(client, source, target, tenant_id)
+        print(f"{tenant_id}: {counts} {'verified' if complete else 'INCOMPLETE'}")
+        logger.log(
+            LogLevel.INFO if complete else LogLevel.ERROR,
+            "MigrateLayout",
+            "tenant migrated" if complete else "tenant migration incomplete",
+            tenant_id=tenant_id,
+            source=args.source,
+            target=args.target,
+        )
+
+        if complete and args.drop_source:
+            source.drop_tenant(client, tenant_id)
+
+    target_service.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,11 @@
 # Danny
 
 from typing import Optional
-from common.constants import Collection
+from common.constants import Collection, ReadRoute
 from msgraph import GraphServiceClient
 from services.m365Connector import deleteAtt
 from services.dataService import MongoDataService
 from services.logService import setup_logger
-from services.tenantService import TenantService
 from common.cipher import UUIDBase62Cipher
 
 mongo = MongoDataService()
@@ -50,14 +49,13 @@ async def delete_attachment(
     message_id: str,
     attachment_id: str,
     request_to_m365: Optional[bool] = True,
+    raise_graph_errors: Optional[bool] = False,
 ):
+    """with raise_graph_errors a failed Graph deletion is raised and the record is kept"""
+    if request_to_m365 and raise_graph_errors:
+        await deleteAtt(client, user_id, message_id, attachment_id, raise_errors=True)
+        request_to_m365 = False
     try:
-        tenant = TenantService(tid)
-
-        # client: GraphServiceClient = await get_graph_client(
-        #     tid, tenant.getTenantAppId(), tenant.getTenantAppSecret()
-        # )
-
         if request_to_m365:
             await deleteAtt(client, user_id, message_id, attachment_id)
 
@@ -99,6 +97,7 @@ async def get_all_attachments(tid: str, /, user_id: str, message_id: str) -> lis
             UUIDBase62Cipher.encode(tid),
             Collection.ATT,
             {"user_id": user_id, "message_id": message_id},
+            route=ReadRoute.SECONDARY,
         )
     except Exception as e:
         logger.error(f"Error occurred in get_attachments: {e}")
@@ -1,15 +1,12 @@
 import json
 import asyncio
-from aiocache import cached, SimpleMemoryCache
 from azure.core.exceptions import ClientAuthenticationError
-from azure.identity import ClientSecretCredential
 from msgraph import GraphServiceClient
 from msgraph.generated.models.o_data_errors.o_data_error import ODataError
 
+from services.credentialManager import CredentialManager
 from services.logService import setup_logger
-from services.m365Connector import getTenantUserList, getTenantAllMails
 
-from services.mailService import getMail
 from services.tenantService import TenantService
 
 
@@ -59,24 +56,18 @@ class MailNotFoundError(Exception):
     pass
 
 
-@cached(ttl=3600, cache=SimpleMemoryCache)
+credential_manager = CredentialManager()
+
+
 async def get_graph_client(
     tenant_id: str, client_id: str, client_secret: str
 ) -> GraphServiceClient:
     """
-    Creates and caches a GraphServiceClient instance for a given tenant.
-    Validates credentials by making a test API call.
+    Returns the GraphServiceClient of a tenant, created once per tenant.
+    Credentials are validated by acquiring an access token.
     """
-    logger.info(f"Creating a new GraphServiceClient instance for tenant {tenant_id}.")
     try:
-        credential = ClientSecretCredential(
-            tenant_id=tenant_id, client_id=client_id, client_secret=client_secret
-        )
-        client = GraphServiceClient(
-            credentials=credential, scopes=["https://graph.microsoft.com/.default"]
-        )
-        await client.users.get()
-        return client
+        return await credential_manager.get_client(tenant_id, client_id, client_secret)
     except ClientAuthenticationError as e:
         logger.error(f"Authentication failed for tenant {tenant_id}: {e}")
         raise GraphAPIError(
@@ -90,9 +81,13 @@ async def get_graph_client(
 
 
 # --- Core Service Functions ---
-async def auth_init_tenant(tenant_id: str, client_id: str, client_secret: str) -> None:
+async def auth_init_tenant(
+    tenant_id: str, client_id: str, client_secret: str
+) -> GraphServiceClient:
     """
-    Initializes a tenant, fetches data, and saves it.
+    Validates the credentials and creates the tenant.
+    Users and mails are fetched afterwards by an onboarding job
+    (see services/onboardingService.py) using the returned client.
     """
     tenant_service = TenantService(tenant_id)
 
@@ -105,18 +100,9 @@ async def auth_init_tenant(tenant_id: str, client_id: str, client_secret: str) -
     try:
         client = await get_graph_client(tenant_id, client_id, client_secret)
 
-        logger.info(f"Fetching user and mail data for tenant {tenant_id}...")
         tenant_service.createTenant(client_id, client_secret)
-        await getMail(client, tenant_id)
-        users = await getTenantUserList(client)
-
-        if not users:
-            logger.warning(f"No users found in tenant {tenant_id}.")
-            raise TenantInitializationError("No users found, initialization aborted.")
-
-        tenant_service.insertUserList(users)
-
-        logger.info(f"Successfully fetched {len(users)} users.")
+        logger.info(f"Tenant {tenant_id} created, onboarding can start.")
+        return client
 
     except ODataError as e:
         logger.error(f"Microsoft Graph API error: {e.error.code} - {e.error.message}")
@@ -149,6 +135,8 @@ async def auth_update_tenant(tenant_id: str, client_id: str, client_secret: str)
 
     try:
         tenant_service.updateTenant(client_id, client_secret)
+        # the next Graph call builds a client with the new credentials
+        await credential_manager.invalidate(tenant_id)
 
     except (GraphAPIError, TenantNotFoundError) as e:
         # Re-raise validation and not-found errors directly.
@@ -0,0 +1,138 @@
+"""
+Per-tenant mail change feed.
+
+Every committed mail change (created, updated, deleted) is appended to
+`inbox_connector_db.mail_events` with a per-tenant sequence number:
+
+    {"tenant": <tenant>, "seq": 42, "type": "created", "user_id": ..., "message_id": ...,
+     "data": {...}, "created_at": ...}
+
+Subscribers (GET /tenant/{tenant_id}/events, Server-Sent Events) resume
+after any sequence number that is still retained (CHANGE_FEED_RETENTION_HOURS).
+Events published by this process wake its subscribers right away, events
+from other processes are picked up within CHANGE_FEED_POLL_SECONDS.
+
+Usage:
+    feed = ChangeFeed(data_service.client)
+    feed.publish(tenant, "created", user_id, message_id, {"subject": ...})
+    async for event in feed.subscribe(tenant, after=41):
+        ...
+"""
+
+import asyncio
+import os
+from datetime import datetime, timedelta, timezone
+
+from pymongo import ASCENDING, ReturnDocument
+
+from services.storageLayout import SHARED_DB_NAME
+
+CHANGE_FEED_RETENTION_HOURS = int(os.getenv("CHANGE_FEED_RETENTION_HOURS", "24"))
+CHANGE_FEED_POLL_SECONDS = float(os.getenv("CHANGE_FEED_POLL_SECONDS", "1"))
+CHANGE_FEED_BATCH_SIZE = 500
+# a missing sequence number older than this was allocated by a publisher that never wrote it
+GAP_GRACE_SECONDS = 5
+EVENTS_COLLECTION = "mail_events"
+SEQUENCES_COLLECTION = "mail_event_sequences"
+EVENT_TYPES = ("created", "updated", "deleted")
+
+
+class ChangeFeed:
+    def __init__(self, client, db_name: str = SHARED_DB_NAME):
+        db = client[db_name]
+        self._events = db[EVENTS_COLLECTION]
+        self._sequences = db[SEQUENCES_COLLECTION]
+        self._events.create_index([("tenant", ASCENDING), ("seq", ASCENDING)], unique=True)
+        self._events.create_index(
+            [("created_at", ASCENDING)], expireAfterSeconds=CHANGE_FEED_RETENTION_HOURS * 3600
+        )
+        self._waiters = {}
+
+    def publish(self, tenant: str, event_type: str, user_id: str, message_id: str, data: dict = None) -> int:
+        """append an event and wake local subscribers, returns its sequence number"""
+        seq = self._sequences.find_one_and_update(
+            {"_id": tenant},
+            {"$inc": {"seq": 1}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )["seq"]
+        self._events.insert_one(
+            {
+                "tenant": tenant,
+                "seq": seq,
+                "type": event_type,
+                "user_id": user_id,
+                "message_id": message_id,
+                "data": data or {},
+                "created_at": datetime.now(timezone.utc),
+            }
+        )
+        for loop, wakeup in list(self._waiters.get(tenant, ())):
+            loop.call_soon_threadsafe(wakeup.set)
+        return seq
+
+    def read(self, tenant: str, after: int, limit: int = CHANGE_FEED_BATCH_SIZE) -> list:
+        """
+        events after `after`, up to the first gap that may still be filled
+
+        Sequence numbers are allocated before the event is written, so a
+        concurrent publisher can leave a short-lived gap.
+        """
+        events = list(
+            self._events.find({"tenant": tenant, "seq": {"$gt": after}}, {"_id": 0, "tenant": 0})
+            .sort("seq", ASCENDING)
+            .limit(limit)
+        )
+        grace = datetime.now(timezone.utc) - timedelta(seconds=GAP_GRACE_SECONDS)
+        expected = after + 1
+        for i, event in enumerate(events):
+            if event["seq"] != expected and event["created_at"].replace(tzinfo=timezone.utc) > grace:
+                return events[:i]
+            expected = event["seq"] + 1
+        return events
+
+    def first_retained(self, tenant: str):
+        first = self._events.find_one({"tenant": tenant}, {"seq": 1}, sort=[("seq", ASCENDING)])
+        return first["seq"] if first else None
+
+    def last_seq(self, tenant: str) -> int:
+        doc = self._sequences.find_one({"_id": tenant})
+        return doc["seq"] if doc else 0
+
+    async def subscribe(self, tenant: str, after: int = None, heartbeat: float = None):
+        """
+        yield events after `after` (by default only new ones) as they commit
+
+        Yields None every `heartbeat` seconds without events, so the caller can
+        keep the connection alive and notice a gone client.
+        """
+        if after is None:
+            after = await asyncio.to_thread(self.last_seq, tenant)
+
+        loop = asyncio.get_running_loop()
+        wakeup = asyncio.Event()
+        waiter = (loop, wakeup)
+        self._waiters.setdefault(tenant, set()).add(waiter)
+        idle = 0.0
+        try:
+            while True:
+                wakeup.clear()
+                events = await asyncio.to_thread(self.read, tenant, after)
+                for event in events:
+                    after = event["seq"]
+                    yield event
+                if events:
+                    idle = 0.0
+                    continue
+                try:
+                    await asyncio.wait_for(wakeup.wait(), timeout=CHANGE_FEED_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    idle += CHANGE_FEED_POLL_SECONDS
+                if heartbeat and idle >= heartbeat:
+                    idle = 0.0
+                    yield None
+        finally:
+            self._waiters[tenant].discard(waiter)
+            if not self._waiters[tenant]:
+                del self._waiters[tenant]
+
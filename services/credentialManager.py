@@ -0,0 +1,232 @@
+"""
+Graph clients and access tokens per tenant.
+
+    - one GraphServiceClient per tenant, created under a per-tenant lock, so
+      concurrent first calls share one creation; the lock only lives while
+      callers wait on it, failed creations leave nothing behind
+    - credentials are validated by acquiring a token, no extra Graph call
+    - tokens are served from memory; within TOKEN_REFRESH_MARGIN_SECONDS of
+      expiry a single background refresh is started while the current token
+      is still used, so Graph calls do not wait for token acquisition
+    - token acquisition (azure-identity, blocking) runs on a worker thread
+    - a client whose tenant credentials changed is replaced
+    - at most GRAPH_CLIENT_CACHE_SIZE clients are kept, the least recently
+      used one (by Graph request, not only by lookup) is evicted
+    - an evicted, invalidated or replaced client may still be held by a job
+      or request, its credential and HTTP connections are closed once the
+      client is garbage collected, never under a caller
+
+Usage:
+    manager = CredentialManager()
+    client = await manager.get_client(tenant_id, client_id, client_secret)
+    await manager.invalidate(tenant_id)   # after a credential update
+    manager.stats()
+"""
+
+import asyncio
+import contextlib
+import hashlib
+import os
+import time
+import weakref
+from collections import OrderedDict
+
+from azure.identity import ClientSecretCredential
+from kiota_authentication_azure.azure_identity_authentication_provider import (
+    AzureIdentityAuthenticationProvider,
+)
+from msgraph import GraphRequestAdapter, GraphServiceClient
+from msgraph.graph_request_adapter import options as graph_client_options
+from msgraph_core import GraphClientFactory
+
+from services.logService import setup_logger
+from services.metricsService import metrics
+
+TOKEN_REFRESH_MARGIN_SECONDS = int(os.getenv("TOKEN_REFRESH_MARGIN_SECONDS", "300"))
+GRAPH_CLIENT_CACHE_SIZE = int(os.getenv("GRAPH_CLIENT_CACHE_SIZE", "512"))
+GRAPH_SCOPES = ["https://graph.microsoft.com/.default"]
+
+logger = setup_logger(__name__)
+
+
+class RefreshingCredential:
+    """async token credential over a blocking one, refreshing ahead of expiry"""
+
+    def __init__(self, credential, margin: int = TOKEN_REFRESH_MARGIN_SECONDS):
+        self._credential = credential
+        self._margin = margin
+        self._token = None
+        self._refresh = None
+
+    async def _fetch(self, scopes):
+        try:
+            token = await asyncio.to_thread(self._credential.get_token, *scopes)
+        except Exception as e:
+            logger.error(f"Token acquisition failed: {e}")
+            raise
+        self._token = token
+        return token
+
+    def _start_refresh(self, scopes) -> asyncio.Future:
+        if self._refresh is None or self._refresh.done():
+            self._refresh = asyncio.ensure_future(self._fetch(scopes))
+            # a failed background refresh is retried by the next caller
+            self._refresh.add_done_callback(lambda task: task.cancelled() or task.exception())
+        return self._refresh
+
+    async def get_token(self, *scopes, claims=None, **kwargs):
+        if claims:
+            # claims challenge (continuous access evaluation), never served from memory
+            return await asyncio.to_thread(self._credential.get_token, *scopes, claims=claims, **kwargs)
+
+        token = self._token
+        remaining = token.expires_on - time.time() if token else 0
+        if remaining <= 0:
+            return await asyncio.shield(self._start_refresh(scopes or GRAPH_SCOPES))
+        if remaining < self._margin:
+            self._start_refresh(scopes or GRAPH_SCOPES)
+        return token
+
+    async def close(self):
+        # kiota closes async credentials after every token, the manager owns their lifetime
+        pass
+
+    async def aclose(self):
+        if self._refresh is not None and not self._refresh.done():
+            self._refresh.cancel()
+        await asyncio.to_thread(self._credential.close)
+
+
+def _fingerprint(client_id: str, client_secret: str) -> str:
+    return hashlib.sha256(f"{client_id}\0{client_secret}".encode("utf-8")).hexdigest()
+
+
+class _TenantClient:
+    def __init__(self, client, credential, http_client, fingerprint):
+        self.client = client
+        self.credential = credential
+        self.http_client = http_client
+        self.fingerprint = fingerprint
+
+
+class CredentialManager:
+    def __init__(self, capacity: int = GRAPH_CLIENT_CACHE_SIZE):
+        self.capacity = capacity
+        self._clients = OrderedDict()
+        # tenant_id -> [lock, callers holding or waiting for it]
+        self._locks = {}
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._invalidations = 0
+        self._retiring = 0
+
+    async def _create(self, tenant_id: str, client_id: str, client_secret: str) -> _TenantClient:
+        credential = RefreshingCredential(
+            ClientSecretCredential(tenant_id=tenant_id, client_id=client_id, client_secret=client_secret)
+        )
+        # validates tenant, client id and secret, and warms the token
+        await credential.get_token(*GRAPH_SCOPES)
+
+        auth_provider = AzureIdentityAuthenticationProvider(credential, scopes=GRAPH_SCOPES)
+        # the SDK's default HTTP client, with request timing for /metrics
+        http_client = GraphClientFactory.create_with_default_middleware(options=graph_client_options)
+        metrics.instrument_graph_client(http_client)
+
+        # a client held by a long job stays recent while it sends requests
+        async def touch(request):
+            if tenant_id in self._clients:
+                self._clients.move_to_end(tenant_id)
+
+        http_client.event_hooks["request"].append(touch)
+        client = GraphServiceClient(request_adapter=GraphRequestAdapter(auth_provider, http_client))
+        return _TenantClient(client, credential, http_client, _fingerprint(client_id, client_secret))
+
+    async def _close(self, credential: RefreshingCredential, http_client) -> None:
+        try:
+            await credential.aclose()
+            await http_client.aclose()
+        except Exception as e:
+            logger.error(f"Error closing a Graph client: {e}")
+        finally:
+            self._retiring -= 1
+
+    def _retire(self, entry: _TenantClient) -> None:
+        """close the entry's credential and HTTP client once nobody holds its GraphServiceClient"""
+        loop = asyncio.get_running_loop()
+        credential, http_client = entry.credential, entry.http_client
+        self._retiring += 1
+
+        def close():
+            # runs where the client is collected, possibly another thread or interpreter exit
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(lambda: asyncio.ensure_future(self._close(credential, http_client)))
+
+        # the callback must not reference the client, or it would never be collected
+        weakref.finalize(entry.client, close)
+
+    async def _evict(self) -> None:
+        while len(self._clients) > self.capacity:
+            tenant_id, entry = self._clients.popitem(last=False)
+            self._evictions += 1
+            logger.info(f"Graph client of tenant {tenant_id} evicted.")
+            self._retire(entry)
+
+    @contextlib.asynccontextmanager
+    async def _creation_lock(self, tenant_id: str):
+        """per-tenant lock, dropped once the last caller using it is done"""
+        slot = self._locks.setdefault(tenant_id, [asyncio.Lock(), 0])
+        slot[1] += 1
+        try:
+            async with slot[0]:
+                yield
+        finally:
+            slot[1] -= 1
+            if not slot[1]:
+                del self._locks[tenant_id]
+
+    async def get_client(self, tenant_id: str, client_id: str, client_secret: str) -> GraphServiceClient:
+        fingerprint = _fingerprint(client_id, client_secret)
+        entry = self._clients.get(tenant_id)
+        if entry is not None and entry.fingerprint == fingerprint:
+            self._clients.move_to_end(tenant_id)
+            self._hits += 1
+            return entry.client
+
+        async with self._creation_lock(tenant_id):
+            # another caller may have created it while we waited
+            entry = self._clients.get(tenant_id)
+            if entry is not None and entry.fingerprint == fingerprint:
+                self._clients.move_to_end(tenant_id)
+                self._hits += 1
+                return entry.client
+
+            self._misses += 1
+            logger.info(f"Creating a new GraphServiceClient instance for tenant {tenant_id}.")
+            created = await self._create(tenant_id, client_id, client_secret)
+            self._clients[tenant_id] = created
+            self._clients.move_to_end(tenant_id)
+            if entry is not None:
+                # the tenant credentials changed
+                self._retire(entry)
+        await self._evict()
+        return created.client
+
+    async def invalidate(self, tenant_id: str) -> None:
+        """drop the client of a tenant, the next get_client() creates a new one"""
+        entry = self._clients.pop(tenant_id, None)
+        if entry is not None:
+            self._invalidations += 1
+            self._retire(entry)
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._clients),
+            "capacity": self.capacity,
+            "hits": self._hits,
+            "misses": self._misses,
+            "evictions": self._evictions,
+            "invalidations": self._invalidations,
+            # dropped from the cache, closed once their last user lets go
+            "retiring": self._retiring,
+        }
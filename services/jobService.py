@@ -0,0 +1,281 @@
+"""
+Background jobs with progress persisted in MongoDB.
+
+A job runs as an asyncio task in the process that created it. Its state is
+written to `inbox_connector_db.jobs`, so any replica can report on it:
+
+    {"_id": <job id>, "kind": "remediation", "tenant_id": <tenant>,
+     "status": "pending|running|succeeded|partial|failed|cancelled",
+     "total": 120, "done": 80, "failed": 2, "progress": {...}, "params": {...},
+     "cancel_requested": False, "created_at": ..., "started_at": ...,
+     "updated_at": ..., "finished_at": ..., "error": None}
+
+Per-item results go to `job_items`, one document per item. Finished jobs and
+their items are removed by MongoDB JOB_RETENTION_DAYS after they end.
+
+Cancelling a job running in this process cancels its task. A job running in
+another process sees `cancel_requested` before its next item. A running job
+without updates for JOB_STALE_SECONDS lost its process: it can be cancelled
+or resumed from anywhere. Resuming keeps the done items, the work is expected
+to skip them.
+
+Usage:
+    jobs = JobManager(data_service.client)
+    job = jobs.create("remediation", tenant_id, params={...})
+    jobs.start(job["_id"], lambda: work(job["_id"]))   # work records items
+    jobs.get(job["_id"])
+"""
+
+import asyncio
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from pymongo import ASCENDING, DESCENDING
+
+from common.constants import LogLevel
+from logger.operationLogger import OperationLogger
+from services.storageLayout import SHARED_DB_NAME
+
+JOB_RETENTION_DAYS = int(os.getenv("JOB_RETENTION_DAYS", "7"))
+JOB_STALE_SECONDS = int(os.getenv("JOB_STALE_SECONDS", "600"))
+JOBS_COLLECTION = "jobs"
+JOB_ITEMS_COLLECTION = "job_items"
+FINAL_STATUSES = ("succeeded", "partial", "failed", "cancelled")
+
+logger = OperationLogger()
+
+
+class JobNotFoundError(Exception):
+    """Raised when a job id is unknown (or belongs to another tenant)."""
+
+    pass
+
+
+class JobStateError(Exception):
+    """Raised when a job cannot be cancelled or resumed in its current state."""
+
+    pass
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class JobManager:
+    def __init__(self, client, db_name: str = SHARED_DB_NAME):
+        db = client[db_name]
+        self._jobs = db[JOBS_COLLECTION]
+        self._items = db[JOB_ITEMS_COLLECTION]
+        self._jobs.create_index([("tenant_id", ASCENDING), ("created_at", DESCENDING)])
+        self._jobs.create_index([("expires_at", ASCENDING)], expireAfterSeconds=0)
+        self._items.create_index([("job_id", ASCENDING), ("index", ASCENDING)], unique=True)
+        self._items.create_index([("expires_at", ASCENDING)], expireAfterSeconds=0)
+        self._tasks = {}
+
+    def create(self, kind: str, tenant_id: str, params: dict = None, total: int = 0) -> dict:
+        now = _now()
+        job = {
+            "_id": uuid.uuid4().hex,
+            "kind": kind,
+            "tenant_id": tenant_id,
+            "status": "pending",
+            "total": total,
+            "done": 0,
+            "failed": 0,
+            "progress": {},
+            "params": params or {},
+            "cancel_requested": False,
+            "created_at": now,
+            "started_at": None,
+            "updated_at": now,
+            "finished_at": None,
+            "error": None,
+        }
+        self._jobs.insert_one(job)
+        logger.log(LogLevel.INFO, "Jobs", "job created", job_id=job["_id"], kind=kind, tenant=tenant_id)
+        return job
+
+    def get(self, job_id: str, tenant_id: str = None) -> dict:
+        query = {"_id": job_id}
+        if tenant_id is not None:
+            query["tenant_id"] = tenant_id
+        job = self._jobs.find_one(query)
+        if job is None:
+            raise JobNotFoundError(f"Job {job_id} not found.")
+        job["eta_seconds"] = self._eta(job)
+        return job
+
+    @staticmethod
+    def _eta(job: dict):
+        """remaining items times the average time per item since the (re)start"""
+        if job["status"] != "running" or not job.get("started_at") or not job["total"]:
+            return None
+        processed = job["done"] + job["failed"] - job.get("processed_at_start", 0)
+        if processed <= 0:
+            return None
+        started_at = job["started_at"].replace(tzinfo=timezone.utc)
+        elapsed = (_now() - started_at).total_seconds()
+        remaining = max(job["total"] - job["done"] - job["failed"], 0)
+        return round(elapsed / processed * remaining, 1)
+
+    def is_stale(self, job: dict) -> bool:
+        """running, but neither here nor updated by another process for JOB_STALE_SECONDS"""
+        if job["status"] not in ("pending", "running") or self.is_running(job["_id"]):
+            return False
+        updated_at = job["updated_at"].replace(tzinfo=timezone.utc)
+        return (_now() - updated_at).total_seconds() > JOB_STALE_SECONDS
+
+    def list(self, tenant_id: str, kind: str = None, limit: int = 50) -> list:
+        query = {"tenant_id": tenant_id}
+        if kind:
+            query["kind"] = kind
+        return list(self._jobs.find(query).sort("created_at", DESCENDING).limit(limit))
+
+    def items(self, job_id: str, status: str = None, limit: int = 100, after: int = -1) -> list:
+        """per-item results of a job, in item order, keyset paginated on `index`"""
+        query = {"job_id": job_id, "index": {"$gt": after}}
+        if status:
+            query["status"] = status
+        return list(
+            self._items.find(query, {"_id": 0, "job_id": 0, "expires_at": 0})
+            .sort("index", ASCENDING)
+            .limit(limit)
+        )
+
+    def set_total(self, job_id: str, total: int) -> None:
+        self._jobs.update_one({"_id": job_id}, {"$set": {"total": total, "updated_at": _now()}})
+
+    def add_progress(self, job_id: str, **counters) -> None:
+        """increment job specific counters, e.g. add_progress(job_id, messages=1)"""
+        self._jobs.update_one(
+            {"_id": job_id},
+            {
+                "$inc": {f"progress.{name}": value for name, value in counters.items()},
+                "$set": {"updated_at": _now()},
+            },
+        )
+
+    def done_items(self, job_id: str) -> list:
+        return [doc["item"] for doc in self._items.find({"job_id": job_id, "status": "done"}, {"item": 1})]
+
+    def next_index(self, job_id: str) -> int:
+        last = self._items.find_one({"job_id": job_id}, {"index": 1}, sort=[("index", DESCENDING)])
+        return last["index"] + 1 if last else 0
+
+    def cancel_requested(self, job_id: str) -> bool:
+        job = self._jobs.find_one({"_id": job_id}, {"cancel_requested": 1})
+        return bool(job and job.get("cancel_requested"))
+
+    def record_item(self, job_id: str, index: int, item: dict, status: str, error: str = None) -> None:
+        """store the result of one item and count it as done or failed"""
+        self._items.update_one(
+            {"job_id": job_id, "index": index},
+            {"$set": {"item": item, "status": status, "error": error, "finished_at": _now()}},
+            upsert=True,
+        )
+        self._jobs.update_one(
+            {"_id": job_id},
+            {"$inc": {"failed" if status == "failed" else "done": 1}, "$set": {"updated_at": _now()}},
+        )
+
+    def _finish(self, job_id: str, status: str, error: str = None) -> None:
+        finished_at = _now()
+        expires_at = finished_at + timedelta(days=JOB_RETENTION_DAYS)
+        self._jobs.update_one(
+            {"_id": job_id},
+            {
+                "$set": {
+                    "status": status,
+                    "error": error,
+                    "finished_at": finished_at,
+                    "updated_at": finished_at,
+                    "expires_at": expires_at,
+                }
+            },
+        )
+        self._items.update_many({"job_id": job_id}, {"$set": {"expires_at": expires_at}})
+        logger.log(LogLevel.INFO, "Jobs", "job finished", job_id=job_id, status=status, error=error)
+
+    async def _run(self, job_id: str, work) -> None:
+        job = self._jobs.find_one({"_id": job_id}, {"done": 1, "failed": 1})
+        now = _now()
+        self._jobs.update_one(
+            {"_id": job_id},
+            {
+                "$set": {
+                    "status": "running",
+                    "started_at": now,
+                    "updated_at": now,
+                    "processed_at_start": job["done"] + job["failed"],
+                }
+            },
+        )
+        try:
+            await work()
+        except asyncio.CancelledError:
+            self._finish(job_id, "cancelled")
+            raise
+        except Exception as e:
+            logger.log(LogLevel.ERROR, "Jobs", "job failed", job_id=job_id, error=str(e))
+            self._finish(job_id, "failed", str(e))
+            return
+        finally:
+            self._tasks.pop(job_id, None)
+
+        job = self.get(job_id)
+        if not job["failed"]:
+            status = "succeeded"
+        else:
+            status = "partial" if job["done"] else "failed"
+        self._finish(job_id, status)
+
+    def start(self, job_id: str, work) -> asyncio.Task:
+        """run `work` (a coroutine function without arguments) in the background"""
+        task = asyncio.create_task(self._run(job_id, work))
+        self._tasks[job_id] = task
+        return task
+
+    def is_running(self, job_id: str) -> bool:
+        return job_id in self._tasks
+
+    def cancel(self, job_id: str, tenant_id: str = None) -> dict:
+        job = self.get(job_id, tenant_id)
+        if job["status"] not in ("pending", "running"):
+            raise JobStateError(f"Job {job_id} is already {job['status']}.")
+
+        self._jobs.update_one({"_id": job_id}, {"$set": {"cancel_requested": True}})
+        task = self._tasks.get(job_id)
+        if task is not None:
+            task.cancel()
+        elif self.is_stale(job):
+            self._finish(job_id, "cancelled", "process lost")
+        logger.log(LogLevel.INFO, "Jobs", "job cancel requested", job_id=job_id)
+        return self.get(job_id)
+
+    def resume(self, job_id: str, work, tenant_id: str = None) -> dict:
+        """run a stopped job again, failed items are retried, done items kept"""
+        job = self.get(job_id, tenant_id)
+        if job["status"] in ("pending", "running") and not self.is_stale(job):
+            raise JobStateError(f"Job {job_id} is still {job['status']}.")
+        if job["status"] == "succeeded":
+            raise JobStateError(f"Job {job_id} already succeeded.")
+
+        self._items.delete_many({"job_id": job_id, "status": {"$ne": "done"}})
+        self._jobs.update_one(
+            {"_id": job_id},
+            {
+                "$set": {
+                    "status": "pending",
+                    "failed": 0,
+                    "cancel_requested": False,
+                    "error": None,
+                    "finished_at": None,
+                },
+                "$unset": {"expires_at": ""},
+            },
+        )
+        self._items.update_many({"job_id": job_id}, {"$unset": {"expires_at": ""}})
+        logger.log(LogLevel.INFO, "Jobs", "job resumed", job_id=job_id)
+        self.start(job_id, work)
+        return self.get(job_id)
@@ -0,0 +1,177 @@
+"""
+Mongo-backed tenant leases for running several sync workers side by side.
+
+Every worker (replica or uvicorn process) heartbeats a document in
+`sync_workers` and holds its tenants through documents in `sync_leases`:
+
+    {"_id": <tenant>, "owner": <worker id>, "expires_at": <datetime>}
+
+A worker keeps at most its fair share, ceil(tenants / live workers), of the
+tenants. When a worker joins, the others release their surplus on their next
+claim. When a worker dies, its heartbeat and leases expire after
+LEASE_TTL_SECONDS and the survivors take its tenants over. Tenants are tried
+in rendezvous-hash order, so workers rarely compete for the same lease.
+
+Usage:
+    leases = LeaseManager(data_service.client)
+    leases.heartbeat()                       # every LEASE_HEARTBEAT_SECONDS
+    tenants = leases.claim(all_tenants)      # tenants this worker should sync
+    leases.shutdown()
+"""
+
+import hashlib
+import math
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from pymongo import ASCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from common.constants import LogLevel
+from logger.operationLogger import OperationLogger
+from services.storageLayout import SHARED_DB_NAME
+
+# "standalone": every process syncs every tenant, "sharded": tenants are leased
+SYNC_WORKER_MODE = os.getenv("SYNC_WORKER_MODE", "standalone")
+LEASE_TTL_SECONDS = int(os.getenv("LEASE_TTL_SECONDS", "60"))
+LEASE_HEARTBEAT_SECONDS = int(os.getenv("LEASE_HEARTBEAT_SECONDS", "15"))
+WORKERS_COLLECTION = "sync_workers"
+LEASES_COLLECTION = "sync_leases"
+
+logger = OperationLogger()
+
+
+def _worker_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+
+def _rendezvous_rank(worker_id: str, tenant: str) -> str:
+    return hashlib.sha1(f"{worker_id}/{tenant}".encode("utf-8")).hexdigest()
+
+
+class LeaseManager:
+    def __init__(self, client, worker_id: str = None, db_name: str = SHARED_DB_NAME, ttl: int = LEASE_TTL_SECONDS):
+        self.worker_id = worker_id or _worker_id()
+        self.ttl = ttl
+        db = client[db_name]
+        self._workers = db[WORKERS_COLLECTION]
+        self._leases = db[LEASES_COLLECTION]
+        # expired documents are cleaned up by MongoDB itself
+        self._workers.create_index([("expires_at", ASCENDING)], expireAfterSeconds=0)
+        self._leases.create_index([("expires_at", ASCENDING)], expireAfterSeconds=0)
+        self._leases.create_index([("owner", ASCENDING)])
+
+    def _expiry(self, now: datetime) -> datetime:
+        return now + timedelta(seconds=self.ttl)
+
+    def heartbeat(self) -> None:
+        """mark this worker alive and extend its leases"""
+        now = datetime.now(timezone.utc)
+        self._workers.update_one(
+            {"_id": self.worker_id},
+            {
+                "$set": {"heartbeat_at": now, "expires_at": self._expiry(now)},
+                "$setOnInsert": {"started_at": now},
+            },
+            upsert=True,
+        )
+        self._leases.update_many(
+            {"owner": self.worker_id, "expires_at": {"$gt": now}},
+            {"$set": {"expires_at": self._expiry(now)}},
+        )
+
+    def live_workers(self) -> list:
+        now = datetime.now(timezone.utc)
+        workers = [doc["_id"] for doc in self._workers.find({"expires_at": {"$gt": now}}, {"_id": 1})]
+        if self.worker_id not in workers:
+            workers.append(self.worker_id)
+        return sorted(workers)
+
+    def is_leader(self) -> bool:
+        """the live worker with the lowest id runs the tenant-independent jobs"""
+        return self.live_workers()[0] == self.worker_id
+
+    def owned(self) -> list:
+        now = datetime.now(timezone.utc)
+        return sorted(
+            doc["_id"]
+            for doc in self._leases.find({"owner": self.worker_id, "expires_at": {"$gt": now}}, {"_id": 1})
+        )
+
+    def _try_claim(self, tenant: str, now: datetime) -> bool:
+        try:
+            self._leases.find_one_and_update(
+                {"_id": tenant, "$or": [{"expires_at": {"$lte": now}}, {"owner": self.worker_id}]},
+                {"$set": {"owner": self.worker_id, "expires_at": self._expiry(now), "claimed_at": now}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+            return True
+        except DuplicateKeyError:
+            # the lease exists and another live worker holds it
+            return False
+
+    def release(self, tenants) -> None:
+        if tenants:
+            self._leases.delete_many({"_id": {"$in": list(tenants)}, "owner": self.worker_id})
+
+    def claim(self, tenants: list, busy=()) -> list:
+        """
+        claim up to the fair share of `tenants`, releasing the surplus
+
+        Args:
+            tenants: every tenant that should be synced by someone
+            busy: tenants this worker is syncing right now, never released
+
+        Returns:
+            list: tenants this worker holds a lease on
+        """
+        self.heartbeat()
+        now = datetime.now(timezone.utc)
+        workers = self.live_workers()
+        fair_share = math.ceil(len(tenants) / len(workers)) if tenants else 0
+
+        wanted = set(tenants)
+        owned = [tenant for tenant in self.owned() if tenant in wanted]
+        self.release(set(self.owned()) - wanted - set(busy))
+
+        if len(owned) > fair_share:
+            releasable = [tenant for tenant in owned if tenant not in busy]
+            surplus = releasable[: len(owned) - fair_share]
+            self.release(surplus)
+            owned = [tenant for tenant in owned if tenant not in surplus]
+
+        candidates = sorted(
+            (tenant for tenant in tenants if tenant not in owned),
+            key=lambda tenant: _rendezvous_rank(self.worker_id, tenant),
+        )
+        for tenant in candidates:
+            if len(owned) >= fair_share:
+                break
+            if self._try_claim(tenant, now):
+                owned.append(tenant)
+
+        logger.log(
+            LogLevel.INFO,
+            "LeaseManager",
+            "claimed tenants",
+            worker=self.worker_id,
+            workers=len(workers),
+            owned=len(owned),
+            fair_share=fair_share,
+        )
+        return sorted(owned)
+
+    def shutdown(self) -> None:
+        """hand every lease back and leave the worker set"""
+        self._leases.delete_many({"owner": self.worker_id})
+        self._workers.delete_one({"_id": self.worker_id})
+
+    def stats(self) -> dict:
+        return {
+            "worker_id": self.worker_id,
+            "live_workers": self.live_workers(),
+            "owned": self.owned(),
+        }
@@ -5,26 +5,44 @@ from msgraph import GraphServiceClient
 from msgraph.generated.users.item.mail_folders.item.messages.delta.delta_request_builder import (
     DeltaRequestBuilder,
 )
+from msgraph.generated.users.users_request_builder import UsersRequestBuilder
 from kiota_abstractions.api_error import APIError
 from kiota_abstractions.base_request_configuration import RequestConfiguration
 from services.logService import setup_logger
 logger = setup_logger(__name__)
 
 
+def _sender_address(message):
+    """lowercased sender address of a Graph message, None if missing"""
+    sender = message.from_ or message.sender
+    if sender and sender.email_address and sender.email_address.address:
+        return sender.email_address.address.lower()
+    return None
+
+
+USER_PAGE_SIZE = 999
+
+
+async def iterTenantUserPages(client: GraphServiceClient):
+    """yield the tenant users one Graph page at a time, errors are raised to the caller"""
+    query = RequestConfiguration(
+        query_parameters=UsersRequestBuilder.UsersRequestBuilderGetQueryParameters(
+            select=["id", "displayName"], top=USER_PAGE_SIZE
+        )
+    )
+    res = await client.users.get(request_configuration=query)
+    while True:
+        yield [{"id": user.id, "display_name": user.display_name} for user in res.value]
+        if not res.odata_next_link:
+            break
+        res = await client.users.with_url(res.odata_next_link).get()
+
+
 async def getTenantUserList(client: GraphServiceClient):
     try:
-        res = await client.users.get()
         users = []
-        while True:
-            users.extend(
-                [
-                    {"id": user.id, "display_name": user.display_name}
-                    for user in res.value
-                ]
-            )
-            if not res.odata_next_link:
-                break
-            res = await client.users.with_url(res.odata_next_link)
+        async for page in iterTenantUserPages(client):
+            users.extend(page)
         return users
     except APIError as e:
         logger.error(f"Error occured when calling getTenantMails: {e.message}", exc_info=True)
@@ -69,6 +87,9 @@ async def getTenantMailChangeSet(
                     {
                         "id": mail.id,
                         "subject": mail.subject,
+                        "internet_message_id": mail.internet_message_id,
+                        "sender": _sender_address(mail),
+                        "received_at": mail.received_date_time,
                         "@removed": mail.additional_data.get("@removed"),
                         "attachments": (
                             [
@@ -134,6 +155,9 @@ async def getUserMails(client: GraphServiceClient, user_id: str):
                     {
                         "id": message.id,
                         "subject": message.subject,
+                        "internet_message_id": message.internet_message_id,
+                        "sender": _sender_address(message),
+                        "received_at": message.received_date_time,
                         "attachments": [
                             {"id": attachment.id, "name": attachment.name}
                             for attachment in message.attachments
@@ -180,22 +204,28 @@ async def getTenantAllMails(client: GraphServiceClient):
         )
 
 
-async def deleteMail(client: GraphServiceClient, user_id: str, message_id: str):
+async def deleteMail(client: GraphServiceClient, user_id: str, message_id: str, raise_errors: bool = False):
+    """Graph errors are logged, and raised to the caller with raise_errors"""
     try:
         await (
             client.users.by_user_id(user_id).messages.by_message_id(message_id).delete()
         )
     except APIError as e:
         logger.error(f"Error occured when calling getTenantMails: {e.message}", exc_info=True)
+        if raise_errors:
+            raise
     except ClientAuthenticationError as e:
         logger.error(
             f"Authentication failed, you might want to check if your client secret is still alive: {e.message}"
         )
+        if raise_errors:
+            raise
 
 
 async def deleteAtt(
-    client: GraphServiceClient, user_id: str, message_id: str, attachment_id: str
+    client: GraphServiceClient, user_id: str, message_id: str, attachment_id: str, raise_errors: bool = False
 ):
+    """Graph errors are logged, and raised to the caller with raise_errors"""
     try:
         await (
             client.users.by_user_id(user_id)
@@ -205,7 +235,11 @@ async def deleteAtt(
         )
     except APIError as e:
         logger.error(f"Error occured when calling getTenantMails: {e.message}", exc_info=True)
+        if raise_errors:
+            raise
     except ClientAuthenticationError as e:
         logger.error(
             f"Authentication failed, you might want to check if your client secret is still alive: {e.message}"
         )
+        if raise_errors:
+            raise
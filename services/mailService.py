@@ -6,17 +6,30 @@ from datetime import datetime, timezone
 import inspect
 
 from services.dataService import DataService
-from services.m365Connector import getEMLByMessageId, getTenantUserList, deleteMail, getTenantMailChangeSet, getUserMails
+from services.m365Connector import (
+    getEMLByMessageId,
+    iterTenantUserPages,
+    deleteMail,
+    getTenantMailChangeSet,
+    getUserMails,
+)
 from common.constants import Collection, LogLevel
+from common.cipher import UUIDBase62Cipher
 from services.tenantService import TenantService
 from logger.operationLogger import OperationLogger
 from services.attService import create_attachment, delete_attachment
+from services.metricsService import metrics
+from services.tracingService import record_error, span_attributes, tracer
+from services.changeFeed import ChangeFeed
 
 logger = OperationLogger()
+# mail fields carried by change feed events
+CHANGE_FEED_FIELDS = ("subject", "sender", "received_at", "internet_message_id", "attachments", "eml_file_id")
 data_service = DataService().get_data_service()
+change_feed = ChangeFeed(data_service.client)
 
 async def getMail(client, tenant_id: str):
-    logger.log(LogLevel.INFO, "getMail", "try to getMail", tenant_id=tenant_id)
+    logger.log(LogLevel.INFO, "getMail", "try to getMail", tenant=tenant_id)
     if not client:
         msg = "Graph client is required"
         logger.log(LogLevel.ERROR, "getMail", msg)
@@ -29,38 +42,56 @@ async def getMail(client, tenant_id: str):
 
     tenant_service = TenantService(tenant_id)
     try:
-        users = await getTenantUserList(client)
-        if not users:
+        users_with_mails = []
+        user_count = 0
+
+        # one Graph page of users at a time, their delta links are written together
+        async for users in iterTenantUserPages(client):
+            user_count += len(users)
+            with tracer.start_as_current_span("sync.user_page", attributes=span_attributes(users=len(users))):
+                delta_links = {}
+                try:
+                    for user in users:
+                        user_id = user.get("id", "")
+                        logger.log(
+                            LogLevel.INFO, "getMail", "Fetching mail for user", tenant=tenant_id, user_id=user_id
+                        )
+
+                        mailbox_attributes = span_attributes(user_id=user_id)
+                        with tracer.start_as_current_span("sync.mailbox", attributes=mailbox_attributes) as span:
+                            try:
+                                infos = await getUserMails(client, user_id)
+                                if infos.get("deltalink"):
+                                    delta_links[user_id] = infos["deltalink"]
+
+                                mails = infos.get("mails", [])
+                                mail_docs = []
+                                for msg in mails:
+                                    mail_doc = await _process_mail(client, user_id, tenant_id, msg)
+                                    mail_docs.append({"mail": mail_doc})
+
+                                users_with_mails.append({
+                                    "user_id": user_id,
+                                    "mails": mail_docs
+                                })
+
+                            except Exception as ue:
+                                logger.log(
+                                    LogLevel.ERROR,
+                                    "getMail",
+                                    "Error fetching mail for user",
+                                    tenant=tenant_id,
+                                    user_id=user_id,
+                                    error=str(ue),
+                                )
+                                record_error(span, ue)
+                                continue  # Skip user on failure
+                finally:
+                    tenant_service.saveDeltaLinks(delta_links)
+
+        if not user_count:
             msg = "No users found in tenant"
             logger.log(LogLevel.WARNING, "getMail", msg, tenant=tenant_id)
-            return _response_success([])
-
-        users_with_mails = []
-
-        for user in users:
-            user_id = user.get("id", "")
-            logger.log(LogLevel.INFO, "getMail", f"Fetching mail for user {user_id}", tenant=tenant_id)
-
-            try:
-                infos = await getUserMails(client, user_id)
-                delta_link = infos.get("deltalink", "")
-                tenant_service.updateTenantUserDeltaLink(user_id, delta_link)
-
-                mails = infos.get("mails", [])
-                mail_docs = []
-                for msg in mails:
-                    mail_doc = await _process_mail(client, user_id, tenant_id, msg)
-                    mail_docs.append({"mail": mail_doc})
-
-                users_with_mails.append({
-                    "user_id": user_id,
-                    "mails": mail_docs
-                })
-
-            except Exception as ue:
-                logger.log(LogLevel.ERROR, "getMail", f"Error fetching mail for user {user_id}", tenant=tenant_id, error=str(ue))
-                continue  # Skip user on failure
-
         return _response_success(users_with_mails)
 
     except Exception as e:
@@ -68,45 +99,94 @@ async def getMail(client, tenant_id: str):
         raise
         # return _response_error(str(e))
 
+async def ingestUserMailbox(client, tenant_id: str, user_id: str, on_mail=None):
+    """
+    initial full fetch of one inbox, the delta link is stored once every mail is in
+
+    await on_mail(eml_bytes) after each stored mail, returns {"messages": n, "bytes": n}
+    """
+    with tracer.start_as_current_span("sync.mailbox", attributes=span_attributes(user_id=user_id)):
+        infos = await getUserMails(client, user_id)
+        if infos is None:
+            raise RuntimeError(f"Failed to list mails of user {user_id}")
+
+        stats = {"messages": 0, "bytes": 0}
+        for msg in infos.get("mails", []):
+            mail_doc = await _process_mail(client, user_id, tenant_id, msg)
+            size = len(mail_doc["content"] or b"")
+            stats["messages"] += 1
+            stats["bytes"] += size
+            if on_mail:
+                await on_mail(size)
+
+        if infos.get("deltalink"):
+            TenantService(tenant_id).saveDeltaLinks({user_id: infos["deltalink"]})
+        metrics.sync_lag.mailbox_synced(UUIDBase62Cipher.encode(tenant_id), user_id)
+        return stats
+
 async def getLatestMail(client: GraphServiceClient, tenant_id):
-    logger.log(LogLevel.INFO, "getLatestMail", "try to getLatestMail", tenant_id=tenant_id)
+    logger.log(LogLevel.INFO, "getLatestMail", "try to getLatestMail", tenant=tenant_id)
     try:
         tenant_service = TenantService(tenant_id)
         encrypted_db_name = tenant_service.getTenantHashed()
-        users = await getTenantUserList(client)
+        # one read for the stored links, one bulk write per Graph page of users
+        stored_links = tenant_service.getTenantDeltaLinks()
 
         changes = []
-        for user in users:
-            user_id = user.get("id")
-            if not user_id:
-                continue
-            delta_link = tenant_service.getTenantUseDeltaLink(user_id)
-            change_result = await getTenantMailChangeSet(client, user_id, delta_link)
-            if not change_result:
-                continue
-
-            delta_link = change_result.get("delta_link", "")
-            tenant_service.updateTenantUserDeltaLink(user_id, delta_link)
-
-            mail_docs = []
-            for mail in change_result["mails"]:
-                message_id = mail.get("id", "")
-
-                if mail.get("@removed"):
-                    logger.log(LogLevel.INFO, "getLatestMail", "Mail was deleted", user_id=user_id, message_id=message_id)
-                    await delMail(client, tenant_id, user_id, message_id)
-                    mail_docs.append({"state": "deleted", "data": message_id})
-                else: # need Updated
-                    try:
-                        mail_doc = await _process_mail(client, user_id, tenant_id, mail)
-                        mail_docs.append({"state": "changed", "data": mail_doc})
-                    except Exception as e:
-                        logger.log(LogLevel.ERROR, "getLatestMail", "Failed to fetch full mail content", message_id=message_id, error=str(e))
-            if mail_docs:
-                changes.append({
-                    "user_id": user_id,
-                    "mails": mail_docs
-                })
+        async for users in iterTenantUserPages(client):
+            with tracer.start_as_current_span("sync.user_page", attributes=span_attributes(users=len(users))):
+                delta_links = {}
+                try:
+                    for user in users:
+                        user_id = user.get("id")
+                        if not user_id:
+                            continue
+                        mailbox_attributes = span_attributes(user_id=user_id)
+                        with tracer.start_as_current_span("sync.mailbox", attributes=mailbox_attributes) as span:
+                            change_result = await getTenantMailChangeSet(client, user_id, stored_links.get(user_id, ""))
+                            if not change_result:
+                                # the connector logged the Graph error
+                                record_error(span, "delta query failed")
+                                continue
+
+                            if change_result.get("delta_link"):
+                                delta_links[user_id] = change_result["delta_link"]
+
+                            mail_docs = []
+                            for mail in change_result["mails"]:
+                                message_id = mail.get("id", "")
+
+                                if mail.get("@removed"):
+                                    logger.log(
+                                        LogLevel.INFO,
+                                        "getLatestMail",
+                                        "Mail was deleted",
+                                        user_id=user_id,
+                                        message_id=message_id,
+                                    )
+                                    await delMail(client, tenant_id, user_id, message_id)
+                                    mail_docs.append({"state": "deleted", "data": message_id})
+                                else: # need Updated
+                                    try:
+                                        mail_doc = await _process_mail(client, user_id, tenant_id, mail)
+                                        mail_docs.append({"state": "changed", "data": mail_doc})
+                                    except Exception as e:
+                                        logger.log(
+                                            LogLevel.ERROR,
+                                            "getLatestMail",
+                                            "Failed to fetch full mail content",
+                                            message_id=message_id,
+                                            error=str(e),
+                                        )
+                                        record_error(span, e)
+                            metrics.sync_lag.mailbox_synced(encrypted_db_name, user_id)
+                            if mail_docs:
+                                changes.append({
+                                    "user_id": user_id,
+                                    "mails": mail_docs
+                                })
+                finally:
+                    tenant_service.saveDeltaLinks(delta_links)
         return _response_success(changes)
 
     except ClientAuthenticationError as e:
@@ -114,14 +194,15 @@ async def getLatestMail(client: GraphServiceClient, tenant_id):
         raise
         # print(f"Authentication failed: {e.message}")
 
-async def delMail(client, tenant_id: str, user_id: str, message_id: str):
+async def delMail(client, tenant_id: str, user_id: str, message_id: str, raise_graph_errors: bool = False):
+    """soft-delete a mail, with raise_graph_errors a failed Graph deletion is raised and nothing is changed locally"""
     logger.log(LogLevel.INFO, "DeleteMail", "Try to delete mail", tenant=tenant_id, user_id=user_id, message_id=message_id)
-    tenant_service = TenantService(tenant_id)
-    encrypted_db_name = tenant_service.getTenantHashed()
+    # only the storage key is needed, no keyring access
+    encrypted_db_name = UUIDBase62Cipher.encode(tenant_id)
 
     try:
         # try to remove mail on m365 by api
-        await deleteMail(client, user_id, message_id)
+        await deleteMail(client, user_id, message_id, raise_errors=raise_graph_errors)
 
         # try to clear info stored on our system
         # 1. query does this mail exist in our system
@@ -174,6 +255,8 @@ async def delMail(client, tenant_id: str, user_id: str, message_id: str):
                 "message_id": message_id
             }, update_doc)
             logger.log(LogLevel.INFO, "DeleteMail", "Soft-deleted message metadata", message_id=message_id)
+            metrics.messages.labels("deleted").inc()
+            _publish_change(encrypted_db_name, "deleted", user_id, message_id)
         return _response_success([])
     except Exception as e:
         logger.log(LogLevel.ERROR, "DeleteMail", "Unexpected error", tenant=tenant_id, message_id=message_id, error=str(e))
@@ -181,6 +264,16 @@ async def delMail(client, tenant_id: str, user_id: str, message_id: str):
         # return _response_error(f"Unexpected error: {str(e)}")
 
 
+def _publish_change(encrypted_db_name, change_type, user_id, message_id, data=None):
+    """push a committed change to the feed, a feed failure never fails the sync"""
+    try:
+        change_feed.publish(encrypted_db_name, change_type, user_id, message_id, data)
+    except Exception as e:
+        logger.log(LogLevel.ERROR, "ChangeFeed", "Failed to publish change", message_id=message_id, error=str(e))
+
+def _change_data(mail_doc):
+    return {key: mail_doc.get(key) for key in CHANGE_FEED_FIELDS if key in mail_doc}
+
 def _now_iso_time():
     return datetime.now().isoformat()
 
@@ -207,9 +300,21 @@ def _response_error(message, code=500):
     }
 
 async def _process_mail(client, user_id, tenant_id, msg: dict):
+    with tracer.start_as_current_span(
+        "mail.process", attributes=span_attributes(user_id=user_id, message_id=msg["id"])
+    ):
+        return await _store_mail(client, user_id, tenant_id, msg)
+
+async def _store_mail(client, user_id, tenant_id, msg: dict):
     synced_at = _now_iso_time()
     message_id = msg["id"]
     subject = msg["subject"]
+    # searchable fields, missing on mails synced before they were stored
+    search_fields = {
+        "internet_message_id": msg.get("internet_message_id"),
+        "sender": msg.get("sender"),
+        "received_at": msg.get("received_at"),
+    }
     attachments = msg["attachments"]
     has_attachments = bool(attachments)
 
@@ -218,80 +323,110 @@ async def _process_mail(client, user_id, tenant_id, msg: dict):
 
     if has_attachments:
         attachments = sorted(attachments, key=lambda x: (x["id"], x["name"]))
-        await _process_att_collection(client, tenant_id, user_id, message_id, attachments)
+        with tracer.start_as_current_span("mail.attachments", attributes=span_attributes(count=len(attachments))):
+            await _process_att_collection(client, tenant_id, user_id, message_id, attachments)
 
     # get eml
-    try:
-        eml_content = await getEMLByMessageId(client, user_id, message_id)
-    except Exception as e:
-        logger.log(LogLevel.ERROR, "EML", "Failed to get EML", user_id=user_id, message_id=message_id, error=str(e))
-        raise
-        # eml_content = None
+    with tracer.start_as_current_span("mail.fetch_eml"):
+        try:
+            eml_content = await getEMLByMessageId(client, user_id, message_id)
+        except Exception as e:
+            logger.log(LogLevel.ERROR, "EML", "Failed to get EML", user_id=user_id, message_id=message_id, error=str(e))
+            raise
+            # eml_content = None
 
     eml_file_id = None
+    eml_replaced = False
     if eml_content:
-        eml_file_id = data_service.save_or_update_eml(encrypted_db_name, message_id, eml_content)
+        with tracer.start_as_current_span("mail.store_eml", attributes=span_attributes(bytes=len(eml_content))):
+            eml_file_id, eml_replaced = data_service.save_or_update_eml(encrypted_db_name, message_id, eml_content)
 
     # exist?
-    existing = data_service.read(encrypted_db_name, Collection.MAIL.value, {
-        "message_id": message_id,
-        "user_id": user_id
-    })
-
-    if not existing:
-        logger.log(LogLevel.INFO, "Metadata", "Creating new metadata record", message_id=message_id)
-        msg_doc = {
+    with tracer.start_as_current_span("mail.upsert_metadata"):
+        existing = data_service.read(encrypted_db_name, Collection.MAIL.value, {
             "message_id": message_id,
-            "user_id": user_id,
-            "subject": subject,
-            "attachments": attachments,
-            "synced_at": synced_at,
-            "change_type": "created",
-            "change_history": [
-                {
-                    "synced_at": synced_at,
-                    "change_type": "created"
-                }
-            ],
-            "eml_file_id": str(eml_file_id) if eml_file_id else "",
-            "is_deleted": False
-        }
-        data_service.create_one(encrypted_db_name, Collection.MAIL.value, msg_doc)
-    else:
-        current = existing[0]
-        diff = _add_diff(current, {
-            "subject": subject,
-            "attachments": attachments,
-        }, keys=["subject", "attachments"])
+            "user_id": user_id
+        })
 
-        if not diff and not eml_file_id:
-            logger.log(LogLevel.INFO, "Metadata", "No change detected", message_id=message_id)
+        if not existing:
+            logger.log(LogLevel.DEBUG, "Metadata", "Creating new metadata record", message_id=message_id)
+            msg_doc = {
+                "message_id": message_id,
+                "user_id": user_id,
+                "subject": subject,
+                **search_fields,
+                "attachments": attachments,
+                "synced_at": synced_at,
+                "change_type": "created",
+                "change_history": [
+                    {
+                        "synced_at": synced_at,
+                        "change_type": "created"
+                    }
+                ],
+                "eml_file_id": str(eml_file_id) if eml_file_id else "",
+                "is_deleted": False
+            }
+            data_service.create_one(encrypted_db_name, Collection.MAIL.value, msg_doc)
+            metrics.messages.labels("created").inc()
+            _publish_change(encrypted_db_name, "created", user_id, message_id, _change_data(msg_doc))
         else:
-            update_doc = {
-                "$set": {
-                    "subject": subject,
-                    "attachments": attachments,
-                    "synced_at": synced_at,
-                    "change_type": "updated"
-                },
-                "$push": {
-                    "change_history": {
+            current = existing[0]
+            diff = _add_diff(current, {
+                "subject": subject,
+                "attachments": attachments,
+            }, keys=["subject", "attachments"])
+
+            eml_swapped = bool(eml_file_id) and current.get("eml_file_id") != eml_file_id
+            # mails synced before the search fields were stored get them now
+            backfill = {k: v for k, v in search_fields.items() if v and not current.get(k)}
+
+            if not diff and not eml_swapped and not backfill:
+                logger.log(LogLevel.DEBUG, "Metadata", "No change detected", message_id=message_id)
+                metrics.messages.labels("unchanged").inc()
+            else:
+                update_doc = {
+                    "$set": {
+                        "subject": subject,
+                        **backfill,
+                        "attachments": attachments,
                         "synced_at": synced_at,
-                        "change_type": "updated",
-                        "diff": diff if diff else {}
+                        "change_type": "updated"
+                    },
+                    "$push": {
+                        "change_history": {
+                            "synced_at": synced_at,
+                            "change_type": "updated",
+                            "diff": diff if diff else {}
+                        }
                     }
                 }
-            }
-            if eml_file_id:
-                update_doc["$set"]["eml_file_id"] = str(eml_file_id)
+                if eml_swapped:
+                    update_doc["$set"]["eml_file_id"] = str(eml_file_id)
 
-            query = {
-                "message_id": message_id,
-                "user_id": user_id
-            }
+                query = {
+                    "message_id": message_id,
+                    "user_id": user_id
+                }
+
+                logger.log(
+                    LogLevel.INFO, "Metadata", "Updated metadata with changes", message_id=message_id, changes=diff
+                )
+                data_service.update_one(encrypted_db_name, Collection.MAIL.value, query, update_doc)
+                metrics.messages.labels("updated").inc()
+                _publish_change(
+                    encrypted_db_name,
+                    "updated",
+                    user_id,
+                    message_id,
+                    {**_change_data(update_doc["$set"]), "diff": diff},
+                )
+
+    # the mails document now points at the new file, drop the previous versions
+    if eml_replaced:
+        with tracer.start_as_current_span("mail.delete_superseded_emls"):
+            data_service.delete_superseded_emls(encrypted_db_name, message_id, eml_file_id)
 
-            logger.log(LogLevel.INFO, "Metadata", "Updated metadata with changes", message_id=message_id, changes=diff)
-            data_service.update_one(encrypted_db_name, Collection.MAIL.value, query, update_doc)
     return {
             "message_id": message_id,
             "user_id": user_id,
@@ -341,8 +476,7 @@ async def _process_attachment_service_action(
     return result
 
 async def _process_att_collection(client, tenant_id, user_id, message_id, attachments):
-    tenant_service = TenantService(tenant_id)
-    encrypted_db_name = tenant_service.getTenantHashed()
+    encrypted_db_name = UUIDBase62Cipher.encode(tenant_id)
 
     existing_att_docs = data_service.read(encrypted_db_name, Collection.ATT.value, {
         "message_id": message_id,
@@ -0,0 +1,239 @@
+"""
+Prometheus metrics, served by GET /metrics (see main.py).
+
+    graph_request_seconds{endpoint,method}          Graph API latency, endpoint with ids replaced by {id}
+    graph_requests_total{endpoint,method,status}    Graph API responses by HTTP status
+    mongo_command_seconds{command,collection}       MongoDB command latency
+    mongo_command_failures_total{command,collection}
+    mail_messages_total{change}                     messages processed by the sync (rate() for messages/s)
+    eml_bytes_total{kind}                           EML bytes written, "raw" and "stored" (after compression)
+    http_request_seconds{method,route,status}       API latency by route template
+    cron_run_seconds{job}                           duration of the scheduled jobs
+    cron_failures_total{job}
+    tenant_sync_lag_seconds{tenant}                 since the last successful sync of the tenant
+    tenant_mailbox_sync_lag_seconds{tenant}         since the last successful sync of its least recent mailbox
+
+Tenant labels are storage keys (as in /tenant/sync/stats), mailboxes are
+aggregated per tenant to keep the series count bounded.
+
+With several worker processes, set PROMETHEUS_MULTIPROC_DIR to an empty
+directory shared by them: /metrics then aggregates every process.
+
+Usage:
+    from services.metricsService import metrics
+    metrics.messages.labels(change="created").inc()
+"""
+
+import functools
+import os
+import re
+import threading
+import time
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    REGISTRY,
+    generate_latest,
+    multiprocess,
+)
+from prometheus_client.core import GaugeMetricFamily
+from pymongo import monitoring
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+CRON_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600)
+# path segments following these Graph collections are ids
+GRAPH_ID_PARENTS = {"users", "messages", "mailFolders", "attachments", "childFolders"}
+GRAPH_FUNCTIONS = {"delta", "$value", "$count", "$ref"}
+GRAPH_VERSION_PREFIX = re.compile(r"^/(v1\.0|beta)")
+
+
+def _graph_endpoint(path: str) -> str:
+    segments = GRAPH_VERSION_PREFIX.sub("", path).strip("/").split("/")
+    normalized = []
+    for i, segment in enumerate(segments):
+        if i > 0 and segments[i - 1] in GRAPH_ID_PARENTS and segment not in GRAPH_FUNCTIONS:
+            normalized.append("{id}")
+        else:
+            normalized.append(segment.split("(")[0])
+    return "/" + "/".join(normalized)
+
+
+class _MongoCommandListener(monitoring.CommandListener):
+    """times every command, the collection is taken from the command document"""
+
+    def __init__(self, seconds: Histogram, failures: Counter):
+        self._seconds = seconds
+        self._failures = failures
+        self._collections = {}
+
+    def _key(self, event):
+        return event.connection_id, event.request_id
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        self._collections[self._key(event)] = collection if isinstance(collection, str) else ""
+
+    def succeeded(self, event):
+        collection = self._collections.pop(self._key(event), "")
+        self._seconds.labels(event.command_name, collection).observe(event.duration_micros / 1e6)
+
+    def failed(self, event):
+        collection = self._collections.pop(self._key(event), "")
+        self._seconds.labels(event.command_name, collection).observe(event.duration_micros / 1e6)
+        self._failures.labels(event.command_name, collection).inc()
+
+
+class _SyncLagCollector:
+    """sync lag gauges computed at scrape time from the last sync timestamps"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tenants = {}
+        self._mailboxes = {}
+
+    def tenant_synced(self, tenant: str) -> None:
+        with self._lock:
+            self._tenants[tenant] = time.time()
+
+    def mailbox_synced(self, tenant: str, user_id: str) -> None:
+        with self._lock:
+            self._mailboxes.setdefault(tenant, {})[user_id] = time.time()
+
+    def collect(self):
+        now = time.time()
+        tenant_lag = GaugeMetricFamily(
+            "tenant_sync_lag_seconds", "Seconds since the last successful sync of the tenant", labels=["tenant"]
+        )
+        mailbox_lag = GaugeMetricFamily(
+            "tenant_mailbox_sync_lag_seconds",
+            "Seconds since the last successful sync of the least recently synced mailbox",
+            labels=["tenant"],
+        )
+        with self._lock:
+            for tenant, synced_at in self._tenants.items():
+                tenant_lag.add_metric([tenant], now - synced_at)
+            for tenant, mailboxes in self._mailboxes.items():
+                if mailboxes:
+                    mailbox_lag.add_metric([tenant], now - min(mailboxes.values()))
+        yield tenant_lag
+        yield mailbox_lag
+
+
+class Metrics:
+    def __init__(self, registry: CollectorRegistry = REGISTRY):
+        self.registry = registry
+        self.graph_seconds = Histogram(
+            "graph_request_seconds",
+            "Microsoft Graph request latency",
+            ["endpoint", "method"],
+            buckets=LATENCY_BUCKETS,
+            registry=registry,
+        )
+        self.graph_requests = Counter(
+            "graph_requests",
+            "Microsoft Graph responses by status",
+            ["endpoint", "method", "status"],
+            registry=registry,
+        )
+        self.mongo_seconds = Histogram(
+            "mongo_command_seconds",
+            "MongoDB command latency",
+            ["command", "collection"],
+            buckets=LATENCY_BUCKETS,
+            registry=registry,
+        )
+        self.mongo_failures = Counter(
+            "mongo_command_failures",
+            "Failed MongoDB commands",
+            ["command", "collection"],
+            registry=registry,
+        )
+        self.messages = Counter(
+            "mail_messages",
+            "Messages processed by the sync",
+            ["change"],
+            registry=registry,
+        )
+        self.eml_bytes = Counter(
+            "eml_bytes",
+            "EML bytes written to GridFS",
+            ["kind"],
+            registry=registry,
+        )
+        self.http_seconds = Histogram(
+            "http_request_seconds",
+            "API request latency",
+            ["method", "route", "status"],
+            buckets=LATENCY_BUCKETS,
+            registry=registry,
+        )
+        self.cron_seconds = Histogram(
+            "cron_run_seconds",
+            "Scheduled job duration",
+            ["job"],
+            buckets=CRON_BUCKETS,
+            registry=registry,
+        )
+        self.cron_failures = Counter(
+            "cron_failures",
+            "Scheduled job runs that raised",
+            ["job"],
+            registry=registry,
+        )
+        self.sync_lag = _SyncLagCollector()
+        registry.register(self.sync_lag)
+        self.mongo_listener = _MongoCommandListener(self.mongo_seconds, self.mongo_failures)
+
+    # --- Graph (httpx event hooks) ---
+    async def _graph_request_started(self, request):
+        request.extensions["metrics_started"] = time.perf_counter()
+
+    async def _graph_response(self, response):
+        request = response.request
+        started = request.extensions.get("metrics_started")
+        endpoint = _graph_endpoint(request.url.path)
+        if started is not None:
+            self.graph_seconds.labels(endpoint, request.method).observe(time.perf_counter() - started)
+        self.graph_requests.labels(endpoint, request.method, str(response.status_code)).inc()
+
+    def instrument_graph_client(self, http_client) -> None:
+        """add timing hooks to the httpx client used by a GraphServiceClient"""
+        hooks = http_client.event_hooks
+        hooks["request"] = hooks.get("request", []) + [self._graph_request_started]
+        hooks["response"] = hooks.get("response", []) + [self._graph_response]
+        http_client.event_hooks = hooks
+
+    # --- scheduled jobs ---
+    def timed_cron(self, job: str):
+        """decorator for the scheduled coroutines"""
+
+        def decorator(fn):
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await fn(*args, **kwargs)
+                except Exception:
+                    self.cron_failures.labels(job).inc()
+                    raise
+                finally:
+                    self.cron_seconds.labels(job).observe(time.perf_counter() - started)
+
+            return wrapper
+
+        return decorator
+
+    def exposition(self) -> tuple:
+        """(body, content type) for GET /metrics"""
+        if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+            registry.register(self.sync_lag)
+            return generate_latest(registry), CONTENT_TYPE_LATEST
+        return generate_latest(self.registry), CONTENT_TYPE_LATEST
+
+
+metrics = Metrics()
@@ -0,0 +1,207 @@
+"""
+Tenant onboarding as a background job.
+
+POST /tenant/init validates the credentials and creates the tenant, then
+the initial mail fetch runs as an "onboarding" job (see services/jobService.py):
+the user directory is walked once, each page of users is stored and its
+mailboxes are queued for the workers right away. Every mailbox is one item,
+at most ONBOARDING_CONCURRENCY mailboxes are fetched at once, and the job
+progress counts messages and EML bytes stored.
+
+While the job is active the tenant info carries `onboarding_job`, and the
+periodic sync leaves the tenant alone. A flag whose job finished or went
+stale without clearing it (process crash) no longer blocks the sync. A resumed job skips the mailboxes
+already done and retries the others.
+
+Usage:
+    job = jobs.create(ONBOARDING_JOB, tenant_id)
+    jobs.start(job["_id"], lambda: onboard_tenant(jobs, job["_id"], client, tenant_id))
+"""
+
+import asyncio
+import os
+import time
+
+from common.cipher import UUIDBase62Cipher
+from common.constants import Collection, LogLevel
+from logger.operationLogger import OperationLogger
+from services.dataService import DataService
+from services.jobService import FINAL_STATUSES, JobNotFoundError
+from services.m365Connector import iterTenantUserPages
+from services.tenantService import TenantService
+from services.tracingService import span_attributes, tracer
+import services.mailService as mail_service
+
+ONBOARDING_JOB = "onboarding"
+ONBOARDING_CONCURRENCY = int(os.getenv("ONBOARDING_CONCURRENCY", "4"))
+# users waiting for a mailbox worker, the directory walk pauses when it is full
+ONBOARDING_QUEUE_SIZE = 1000
+# how often a running job reads its cancel_requested flag
+CANCEL_CHECK_SECONDS = 5
+# messages counted in memory before the job progress is written
+PROGRESS_BATCH_MESSAGES = 100
+
+logger = OperationLogger()
+data_service = DataService().get_data_service()
+
+
+def _set_onboarding_flag(tenant_id: str, job_id: str = None) -> None:
+    data_service.update_one(
+        UUIDBase62Cipher.encode(tenant_id),
+        Collection.INFO,
+        {"_id": "singleton"},
+        {"$set": {"onboarding_job": job_id}},
+    )
+
+
+def is_onboarding(jobs, encrypted_db_name: str) -> bool:
+    """
+    whether an onboarding job currently owns the tenant
+
+    A flag left by a job that finished, vanished or went stale (its process
+    died, see JobManager.is_stale) is cleared, resuming the job sets it again.
+    """
+    info = data_service.find_one(
+        encrypted_db_name, Collection.INFO, {"_id": "singleton"}, projection={"onboarding_job": 1}
+    )
+    job_id = info.get("onboarding_job") if info else None
+    if not job_id:
+        return False
+    try:
+        job = jobs.get(job_id)
+    except JobNotFoundError:
+        job = None
+    if job is not None and job["status"] not in FINAL_STATUSES and not jobs.is_stale(job):
+        return True
+
+    data_service.update_one(
+        encrypted_db_name,
+        Collection.INFO,
+        {"_id": "singleton", "onboarding_job": job_id},
+        {"$set": {"onboarding_job": None}},
+    )
+    logger.log(LogLevel.WARNING, "Onboarding", "stale onboarding flag cleared", tenant=encrypted_db_name, job_id=job_id)
+    return False
+
+
+async def onboard_tenant(jobs, job_id: str, client, tenant_id: str) -> None:
+    """
+    store the tenant users and fetch every mailbox, recording one job item per user
+
+    The directory is walked once: every page of users is stored and handed
+    to the mailbox workers while the next page is requested.
+    """
+    attributes = span_attributes(tenant=UUIDBase62Cipher.encode(tenant_id), mode="onboarding", job_id=job_id)
+    # the workers are started inside the span, their mailbox spans join this trace
+    with tracer.start_as_current_span("sync.tenant", attributes=attributes):
+        await _onboard_tenant(jobs, job_id, client, tenant_id)
+
+
+async def _onboard_tenant(jobs, job_id: str, client, tenant_id: str) -> None:
+    _set_onboarding_flag(tenant_id, job_id)
+    try:
+        tenant_service = TenantService(tenant_id)
+        stored = {user["id"] for user in tenant_service.getTenantUser()}
+        # a resumed job keeps the mailboxes it finished before
+        done = {item["user_id"] for item in jobs.done_items(job_id)}
+        pending = asyncio.Queue(maxsize=ONBOARDING_QUEUE_SIZE)
+        counts = {"users": 0, "queued": 0}
+        state = {"cancel_requested": False, "checked_at": None, "workers_done": False}
+
+        async def cancel_requested():
+            # another process may request the cancel, read the job at most every CANCEL_CHECK_SECONDS
+            now = time.monotonic()
+            if state["checked_at"] is None or now - state["checked_at"] >= CANCEL_CHECK_SECONDS:
+                state["checked_at"] = now
+                state["cancel_requested"] = await asyncio.to_thread(jobs.cancel_requested, job_id)
+            return state["cancel_requested"]
+
+        async def produce():
+            index = jobs.next_index(job_id)
+            try:
+                async for page in iterTenantUserPages(client):
+                    if await cancel_requested():
+                        return
+                    counts["users"] += len(page)
+                    new_users = [user for user in page if user["id"] not in stored]
+                    if new_users:
+                        await asyncio.to_thread(tenant_service.insertUserList, new_users)
+                        stored.update(user["id"] for user in new_users)
+                    remaining = [user for user in page if user["id"] not in done]
+                    counts["queued"] += len(remaining)
+                    jobs.set_total(job_id, len(done) + counts["queued"])
+                    for user in remaining:
+                        await pending.put((index, user))
+                        index += 1
+            finally:
+                # the workers stop at the sentinels, once they are gone nobody takes them
+                if not state["workers_done"]:
+                    for _ in range(ONBOARDING_CONCURRENCY):
+                        await pending.put(None)
+
+        async def ingest(index, user):
+            item = {"user_id": user["id"]}
+            # progress of this mailbox not written yet, one job update per PROGRESS_BATCH_MESSAGES
+            unsaved = {"messages": 0, "bytes": 0}
+
+            async def save_progress():
+                if unsaved["messages"]:
+                    progress = dict(unsaved)
+                    unsaved.update(messages=0, bytes=0)
+                    await asyncio.to_thread(jobs.add_progress, job_id, **progress)
+
+            async def on_mail(size):
+                unsaved["messages"] += 1
+                unsaved["bytes"] += size
+                if unsaved["messages"] >= PROGRESS_BATCH_MESSAGES:
+                    await save_progress()
+
+            try:
+                stats = await mail_service.ingestUserMailbox(client, tenant_id, user["id"], on_mail=on_mail)
+                await save_progress()
+                jobs.record_item(job_id, index, {**item, **stats}, "done")
+            except Exception as e:
+                logger.log(LogLevel.ERROR, "Onboarding", "mailbox failed", job_id=job_id, error=str(e), **item)
+                # the mails stored before the failure count as progress
+                await save_progress()
+                jobs.record_item(job_id, index, item, "failed", str(e))
+
+        async def worker():
+            while (entry := await pending.get()) is not None:
+                try:
+                    if not await cancel_requested():
+                        await ingest(*entry)
+                except Exception as e:
+                    # e.g. the job item could not be recorded, the worker goes on with the next mailbox
+                    logger.log(LogLevel.ERROR, "Onboarding", "mailbox not recorded", job_id=job_id, error=str(e))
+
+        producer = asyncio.create_task(produce())
+        try:
+            # workers finish their mailboxes even when the directory walk fails
+            worker_results = await asyncio.gather(
+                *(worker() for _ in range(ONBOARDING_CONCURRENCY)), return_exceptions=True
+            )
+        finally:
+            # no worker takes from the queue anymore, a producer still waiting on it would block forever
+            state["workers_done"] = True
+            producer.cancel()
+        produced = (await asyncio.gather(producer, return_exceptions=True))[0]
+        for result in (*worker_results, produced):
+            if isinstance(result, Exception):
+                raise result
+        if not counts["users"]:
+            raise RuntimeError("No users found, initialization aborted.")
+        logger.log(
+            LogLevel.INFO,
+            "Onboarding",
+            "mailboxes fetched",
+            job_id=job_id,
+            tenant=tenant_id,
+            users=counts["users"],
+            skipped=len(done),
+            fetched=counts["queued"],
+        )
+        if jobs.cancel_requested(job_id):
+            raise asyncio.CancelledError()
+    finally:
+        _set_onboarding_flag(tenant_id)
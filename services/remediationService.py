@@ -0,0 +1,129 @@
+"""
+Bulk remediation: delete the same mail (or attachment) from many mailboxes.
+
+Targets are given explicitly as (user_id, message_id[, attachment_id]), or
+selected from the synced mails by internet message ID or exact subject. They
+are deleted through the single-item paths (mailService.delMail and
+attService.delete_attachment) with one Graph client and at most
+REMEDIATION_CONCURRENCY deletions in flight. A target Graph refuses to
+delete (403, 404, 429 ...) is recorded as failed with the Graph error and
+its local records are kept. Every target is recorded as an
+item of the job, see services/jobService.py.
+
+Usage:
+    job = jobs.create("remediation", tenant_id, params=criteria)
+    jobs.start(job["_id"], lambda: remediate(jobs, job["_id"], client, tenant_id, **criteria))
+"""
+
+import asyncio
+import os
+
+from kiota_abstractions.api_error import APIError
+
+from common.cipher import UUIDBase62Cipher
+from common.constants import Collection, LogLevel
+from logger.operationLogger import OperationLogger
+from services.dataService import DataService
+import services.attService as attachment_service
+import services.mailService as mail_service
+
+REMEDIATION_CONCURRENCY = int(os.getenv("REMEDIATION_CONCURRENCY", "8"))
+REMEDIATION_MAX_TARGETS = int(os.getenv("REMEDIATION_MAX_TARGETS", "50000"))
+
+logger = OperationLogger()
+data_service = DataService().get_data_service()
+
+
+def resolve_targets(tenant_id: str, targets: list = None, internet_message_id: str = None, subject: str = None) -> list:
+    """
+    explicit targets followed by the synced mails matching the criteria
+
+    Returns:
+        list: dicts with user_id, message_id and optionally attachment_id, without duplicates
+    """
+    resolved = []
+    seen = set()
+
+    def add(target):
+        key = (target["user_id"], target["message_id"], target.get("attachment_id"))
+        if key not in seen:
+            seen.add(key)
+            resolved.append(target)
+
+    for target in targets or []:
+        add({k: v for k, v in target.items() if v is not None})
+
+    criteria = {}
+    if internet_message_id:
+        criteria["internet_message_id"] = internet_message_id
+    if subject:
+        criteria["subject"] = subject
+    if criteria:
+        criteria["is_deleted"] = {"$ne": True}
+        for mail in data_service.find(
+            UUIDBase62Cipher.encode(tenant_id),
+            Collection.MAIL,
+            criteria,
+            projection={"user_id": 1, "message_id": 1},
+        ):
+            add({"user_id": mail["user_id"], "message_id": mail["message_id"]})
+
+    if len(resolved) > REMEDIATION_MAX_TARGETS:
+        raise ValueError(f"{len(resolved)} targets exceed REMEDIATION_MAX_TARGETS ({REMEDIATION_MAX_TARGETS})")
+    return resolved
+
+
+def _graph_error(e: APIError) -> str:
+    return f"Graph {e.response_status_code}: {e.message or type(e).__name__}"
+
+
+async def _remediate_one(client, tenant_id: str, target: dict) -> None:
+    """delete one target, Graph failures are raised so the item is not recorded as done"""
+    try:
+        if target.get("attachment_id"):
+            deleted = await attachment_service.delete_attachment(
+                client,
+                tenant_id,
+                user_id=target["user_id"],
+                message_id=target["message_id"],
+                attachment_id=target["attachment_id"],
+                request_to_m365=True,
+                raise_graph_errors=True,
+            )
+            if not deleted:
+                raise RuntimeError("attachment deletion failed")
+            return
+
+        result = await mail_service.delMail(
+            client, tenant_id, target["user_id"], target["message_id"], raise_graph_errors=True
+        )
+    except APIError as e:
+        raise RuntimeError(_graph_error(e)) from e
+    if result.get("status") != "success":
+        raise RuntimeError(result.get("message", "mail deletion failed"))
+
+
+async def remediate(jobs, job_id: str, client, tenant_id: str, targets: list = None,
+                    internet_message_id: str = None, subject: str = None) -> None:
+    """resolve the targets and delete them, recording every one on the job"""
+    resolved = await asyncio.to_thread(resolve_targets, tenant_id, targets, internet_message_id, subject)
+    jobs.set_total(job_id, len(resolved))
+    logger.log(LogLevel.INFO, "Remediation", "targets resolved", job_id=job_id, tenant=tenant_id, total=len(resolved))
+
+    # workers share one iterator, so at most REMEDIATION_CONCURRENCY targets are in flight
+    pending = iter(enumerate(resolved))
+
+    async def worker():
+        for index, target in pending:
+            if jobs.cancel_requested(job_id):
+                return
+            try:
+                await _remediate_one(client, tenant_id, target)
+                jobs.record_item(job_id, index, target, "done")
+            except Exception as e:
+                logger.log(LogLevel.ERROR, "Remediation", "target failed", job_id=job_id, error=str(e), **target)
+                jobs.record_item(job_id, index, target, "failed", str(e))
+
+    await asyncio.gather(*(worker() for _ in range(min(REMEDIATION_CONCURRENCY, len(resolved)))))
+    if jobs.cancel_requested(job_id):
+        raise asyncio.CancelledError()
@@ -0,0 +1,258 @@
+"""
+Retention engine: bulk purge of old EML bodies, old mail metadata and
+soft-deleted mails, per tenant.
+
+Each tenant has a policy (days, 0 keeps forever) stored in its info
+collection; missing fields fall back to the RETENTION_* defaults.
+
+    eml_days       EML files older than this are removed, the mail keeps its metadata
+    metadata_days  mails received longer ago than this are removed with their EML
+                   and attachment rows (mails stored without received_at by their sync time)
+    deleted_days   soft-deleted mails (see mailService.delMail) older than this are removed
+
+Purging runs in batches of RETENTION_BATCH_SIZE on a worker thread and sleeps
+between batches so no more than RETENTION_MAX_DOCS_PER_SECOND documents are
+removed per second, leaving the primary to the API and the sync. Every purge
+predicate is backed by an index from dataService.TENANT_INDEXES.
+
+Usage:
+    from services.retentionService import purge_tenant
+    report = await purge_tenant(encrypted_db_name)
+"""
+
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+from bson import ObjectId
+
+from common.constants import Collection, LogLevel
+from logger.operationLogger import OperationLogger
+from services.dataService import DataService
+
+RETENTION_DOC_ID = "retention"
+RETENTION_FIELDS = ("eml_days", "metadata_days", "deleted_days")
+DEFAULT_POLICY = {
+    "eml_days": int(os.getenv("RETENTION_EML_DAYS", "0")),
+    "metadata_days": int(os.getenv("RETENTION_METADATA_DAYS", "0")),
+    "deleted_days": int(os.getenv("RETENTION_DELETED_DAYS", "30")),
+}
+RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", "1000"))
+RETENTION_MAX_DOCS_PER_SECOND = int(os.getenv("RETENTION_MAX_DOCS_PER_SECOND", "5000"))
+
+logger = OperationLogger()
+data_service = DataService().get_data_service()
+
+
+def get_retention_policy(encrypted_db_name: str) -> dict:
+    """policy of a tenant, defaults filled in"""
+    docs = data_service.read(
+        encrypted_db_name, Collection.INFO, {"_id": RETENTION_DOC_ID}, limit=1
+    )
+    stored = docs[0] if docs else {}
+    return {
+        field: stored.get(field) if stored.get(field) is not None else DEFAULT_POLICY[field]
+        for field in RETENTION_FIELDS
+    }
+
+
+def set_retention_policy(encrypted_db_name: str, **policy) -> dict:
+    """store the given policy fields (None leaves a field unchanged)"""
+    changes = {k: v for k, v in policy.items() if k in RETENTION_FIELDS and v is not None}
+    if any(not isinstance(v, int) or v < 0 for v in changes.values()):
+        raise ValueError("retention days must be non-negative integers")
+
+    if changes:
+        data_service.update_one(
+            encrypted_db_name,
+            Collection.INFO,
+            {"_id": RETENTION_DOC_ID},
+            {"$set": changes},
+            upsert=True,
+        )
+        logger.log(
+            LogLevel.INFO,
+            "Retention",
+            "policy updated",
+            tenant=encrypted_db_name,
+            **changes,
+        )
+    return get_retention_policy(encrypted_db_name)
+
+
+def _cutoff(days: int) -> datetime:
+    return datetime.now(timezone.utc) - timedelta(days=days)
+
+
+def _eml_lengths(encrypted_db_name: str, file_ids: list) -> int:
+    docs = data_service.aggregate(
+        encrypted_db_name,
+        Collection.FS_FILES,
+        [
+            {"$match": {"_id": {"$in": file_ids}}},
+            {"$group": {"_id": None, "bytes": {"$sum": "$length"}}},
+        ],
+    )
+    return next(iter(docs), {}).get("bytes", 0)
+
+
+def _purge_eml_batch(encrypted_db_name: str, cutoff: datetime) -> tuple:
+    """returns (files removed, bytes reclaimed)"""
+    files = list(
+        data_service.aggregate(
+            encrypted_db_name,
+            Collection.FS_FILES,
+            [
+                {"$match": {"uploadDate": {"$lt": cutoff}}},
+                {"$limit": RETENTION_BATCH_SIZE},
+                {"$project": {"_id": 1, "length": 1}},
+            ],
+        )
+    )
+    if not files:
+        return 0, 0
+
+    file_ids = [doc["_id"] for doc in files]
+    # drop the references first, a crash in between leaves orphans for the sweeper
+    data_service.update_many(
+        encrypted_db_name,
+        Collection.MAIL,
+        {"eml_file_id": {"$in": [str(file_id) for file_id in file_ids]}},
+        {"$set": {"eml_file_id": "", "eml_purged_at": datetime.now(timezone.utc)}},
+    )
+    data_service.delete_eml_files(encrypted_db_name, file_ids)
+    return len(file_ids), sum(doc.get("length", 0) for doc in files)
+
+
+def _purge_mail_batch(encrypted_db_name: str, query: dict) -> tuple:
+    """returns (mails removed, attachment rows removed, bytes reclaimed)"""
+    mails = list(
+        data_service.aggregate(
+            encrypted_db_name,
+            Collection.MAIL,
+            [
+                {"$match": query},
+                {"$limit": RETENTION_BATCH_SIZE},
+                {
+                    "$project": {
+                        "user_id": 1,
+                        "message_id": 1,
+                        "eml_file_id": 1,
+                        "size": {"$bsonSize": "$$ROOT"},
+                    }
+                },
+            ],
+        )
+    )
+    if not mails:
+        return 0, 0, 0
+
+    reclaimed = sum(doc.get("size", 0) for doc in mails)
+
+    attachments = data_service.delete_many(
+        encrypted_db_name,
+        Collection.ATT,
+        {"$or": [{"user_id": doc["user_id"], "message_id": doc["message_id"]} for doc in mails]},
+    )
+
+    file_ids = [ObjectId(doc["eml_file_id"]) for doc in mails if doc.get("eml_file_id")]
+    if file_ids:
+        reclaimed += _eml_lengths(encrypted_db_name, file_ids)
+        data_service.delete_eml_files(encrypted_db_name, file_ids)
+
+    removed = data_service.delete_many(
+        encrypted_db_name, Collection.MAIL, {"_id": {"$in": [doc["_id"] for doc in mails]}}
+    )
+    return removed, attachments, reclaimed
+
+
+async def _throttle(removed: int):
+    """sleep long enough to stay under RETENTION_MAX_DOCS_PER_SECOND"""
+    await asyncio.sleep(removed / RETENTION_MAX_DOCS_PER_SECOND)
+
+
+async def purge_tenant(encrypted_db_name: str, policy: dict = None) -> dict:
+    """
+    apply the retention policy of a tenant
+
+    Returns:
+        dict: report with removed counts and bytes reclaimed per category
+    """
+    policy = policy or get_retention_policy(encrypted_db_name)
+    started = time.monotonic()
+    report = {
+        "tenant": encrypted_db_name,
+        "policy": policy,
+        "eml_files": 0,
+        "eml_bytes": 0,
+        "metadata_mails": 0,
+        "metadata_bytes": 0,
+        "deleted_mails": 0,
+        "deleted_bytes": 0,
+        "attachments": 0,
+    }
+
+    try:
+        if policy["deleted_days"]:
+            query = {"is_deleted": True, "updated_at": {"$lt": _cutoff(policy["deleted_days"])}}
+            while True:
+                removed, attachments, reclaimed = await asyncio.to_thread(
+                    _purge_mail_batch, encrypted_db_name, query
+                )
+                if not removed:
+                    break
+                report["deleted_mails"] += removed
+                report["deleted_bytes"] += reclaimed
+                report["attachments"] += attachments
+                await _throttle(removed)
+
+        if policy["metadata_days"]:
+            cutoff = _cutoff(policy["metadata_days"])
+            # message age; mails synced before received_at was stored fall back to their sync time
+            query = {
+                "$or": [
+                    {"received_at": {"$lt": cutoff}},
+                    {"received_at": None, "created_at": {"$lt": cutoff}},
+                ]
+            }
+            while True:
+                removed, attachments, reclaimed = await asyncio.to_thread(
+                    _purge_mail_batch, encrypted_db_name, query
+                )
+                if not removed:
+                    break
+                report["metadata_mails"] += removed
+                report["metadata_bytes"] += reclaimed
+                report["attachments"] += attachments
+                await _throttle(removed)
+
+        if policy["eml_days"]:
+            cutoff = _cutoff(policy["eml_days"])
+            while True:
+                removed, reclaimed = await asyncio.to_thread(
+                    _purge_eml_batch, encrypted_db_name, cutoff
+                )
+                if not removed:
+                    break
+                report["eml_files"] += removed
+                report["eml_bytes"] += reclaimed
+                await _throttle(removed)
+
+    except Exception as e:
+        logger.log(LogLevel.ERROR, "Retention", "purge failed", tenant=encrypted_db_name, error=str(e))
+        raise
+
+    report["bytes_reclaimed"] = report["eml_bytes"] + report["metadata_bytes"] + report["deleted_bytes"]
+    report["seconds"] = round(time.monotonic() - started, 3)
+    logger.log(
+        LogLevel.INFO,
+        "Retention",
+        "purge finished",
+        tenant=encrypted_db_name,
+        bytes_reclaimed=report["bytes_reclaimed"],
+        eml_files=report["eml_files"],
+        metadata_mails=report["metadata_mails"],
+        deleted_mails=report["deleted_mails"],
+    )
+    return report
@@ -1,12 +1,20 @@
 # tenant_router.py
+import asyncio
+import json
+import re
 from pydantic import BaseModel, Field
-from fastapi import APIRouter, HTTPException, Body, Path, status, Response
+from fastapi import APIRouter, HTTPException, Body, Path, Query, Request, status, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from bson import ObjectId
+from bson.errors import InvalidId
 
 import services.authService as auth_service
 import services.attService as attachment_service
 from services.logService import setup_logger
 
-from datetime import datetime
+from datetime import datetime, timezone
 
 logger = setup_logger(__name__)
 router = APIRouter(prefix="/tenant", tags=["Tenant Management"])
@@ -20,6 +28,30 @@ class TenantCredentials(BaseModel):
     client_secret: str = Field(..., example="your-client-secret")
 
 
+class RetentionPolicy(BaseModel):
+    """Retention windows in days, 0 keeps forever, omitted fields stay unchanged."""
+
+    eml_days: int | None = Field(None, ge=0, example=365)
+    metadata_days: int | None = Field(None, ge=0, example=0)
+    deleted_days: int | None = Field(None, ge=0, example=30)
+
+
+class RemediationTarget(BaseModel):
+    """A mail, or one attachment of it, in a user's mailbox."""
+
+    user_id: str = Field(..., example="user-guid")
+    message_id: str = Field(..., example="graph-message-id")
+    attachment_id: str | None = Field(None, example="graph-attachment-id")
+
+
+class RemediationRequest(BaseModel):
+    """Explicit targets and/or criteria matched against the synced mails."""
+
+    targets: list[RemediationTarget] = Field(default_factory=list)
+    internet_message_id: str | None = Field(None, example="<id@example.com>")
+    subject: str | None = Field(None, example="Urgent: verify your account")
+
+
 class SuccessResponse(BaseModel):
     """Generic success response schema."""
 
@@ -33,102 +65,498 @@ import services.m365Connector as m365API
 from services.tenantService import TenantService
 from services.dataService import DataService
 import services.mailService as mail_service
-from common.constants import Collection
+import services.retentionService as retention_service
+import services.remediationService as remediation_service
+import services.onboardingService as onboarding_service
+from services.jobService import JobManager, JobNotFoundError, JobStateError
+from services.syncScheduler import TenantSyncScheduler
+from services.leaseService import LeaseManager, SYNC_WORKER_MODE
+from services.singleFlight import SingleFlight
+from services.metricsService import metrics
+from services.tracingService import span_attributes, tracer
+from common.constants import Collection, ReadRoute
 from common.cipher import UUIDBase62Cipher
 
 data_service = DataService().get_data_service()
+sync_scheduler = TenantSyncScheduler()
+lease_manager = LeaseManager(data_service.client) if SYNC_WORKER_MODE == "sharded" else None
+job_manager = JobManager(data_service.client)
+# full resyncs (GET /{tenant_id}/mails) of a tenant share one run
+full_sync_flight = SingleFlight("full_sync")
+
+MAX_PAGE_SIZE = 1000
+SSE_HEARTBEAT_SECONDS = 15
+SSE_RETRY_MILLISECONDS = 3000
+JOB_ITEMS_PAGE_SIZE = 100
+SEARCH_PAGE_SIZE = 100
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+STREAM_FLUSH_BYTES = 64 * 1024
+EML_STREAM_CHUNK_SIZE = 256 * 1024
+# change_history grows with every sync, list endpoints leave it out
+MAIL_LIST_PROJECTION = {"change_history": 0}
+
+
+def _keyset_query(query, after):
+    """restrict query to documents after the given cursor (an `_id`) in `_id` order"""
+    if after:
+        try:
+            query["_id"] = {"$gt": ObjectId(after)}
+        except (InvalidId, TypeError):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid cursor: {after}"
+            )
+    return query
+
+
+def _search_cursor(mail):
+    """`<received_at in epoch ms>_<_id>`, received_at empty when the mail has none"""
+    received_at = mail.get("received_at")
+    if received_at is None:
+        return f"_{mail['_id']}"
+    if received_at.tzinfo is None:
+        received_at = received_at.replace(tzinfo=timezone.utc)
+    return f"{round(received_at.timestamp() * 1000)}_{mail['_id']}"
+
+
+def _search_keyset_query(query, after):
+    """restrict query to mails after the cursor in (received_at, _id) descending order"""
+    if after:
+        try:
+            received_ms, _, mail_id = after.partition("_")
+            mail_id = ObjectId(mail_id)
+            received_at = (
+                datetime.fromtimestamp(int(received_ms) / 1000, tz=timezone.utc) if received_ms else None
+            )
+        except (InvalidId, TypeError, ValueError):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid cursor: {after}"
+            )
+        query["$or"] = [{"received_at": received_at, "_id": {"$lt": mail_id}}]
+        if received_at is not None:
+            # mails without received_at sort after every date, $lt does not match them
+            query["$or"] += [{"received_at": {"$lt": received_at}}, {"received_at": None}]
+    return query
+
+
+def _stream_json_array(documents):
+    """encode an iterator of documents as a JSON array, chunk by chunk"""
+    buffer = bytearray(b"[")
+    first = True
+    for doc in documents:
+        if not first:
+            buffer += b","
+        buffer += json.dumps(jsonable_encoder(doc)).encode("utf-8")
+        first = False
+        if len(buffer) >= STREAM_FLUSH_BYTES:
+            yield bytes(buffer)
+            buffer.clear()
+    buffer += b"]"
+    yield bytes(buffer)
+
+
+async def _aiter_file(reader, start=0, length=None, chunk_size=EML_STREAM_CHUNK_SIZE):
+    """
+    read `length` bytes from `start` of a file-like object, chunk by chunk,
+    off the event loop, closing it at the end
+    """
+    try:
+        if start:
+            await run_in_threadpool(reader.seek, start)
+        remaining = length
+        while remaining is None or remaining > 0:
+            size = chunk_size if remaining is None else min(chunk_size, remaining)
+            chunk = await run_in_threadpool(reader.read, size)
+            if not chunk:
+                break
+            if remaining is not None:
+                remaining -= len(chunk)
+            yield chunk
+    finally:
+        reader.close()
+
+
+class _RangeNotSatisfiable(Exception):
+    pass
+
+
+def _parse_range(header, length):
+    """
+    parse a single `bytes=` range into inclusive (start, end)
+
+    Returns None when the whole content should be served (no, malformed,
+    multi-part or end-before-start range, which RFC 9110 says to ignore),
+    raises _RangeNotSatisfiable when it starts past the content.
+    """
+    if not header or not header.strip().startswith("bytes="):
+        return None
+    spec = header.strip()[len("bytes="):]
+    if "," in spec:
+        return None
+    start_text, _, end_text = spec.partition("-")
+    try:
+        if start_text.strip():
+            start = int(start_text)
+            end = length - 1
+            if end_text.strip():
+                if int(end_text) < start:
+                    return None
+                end = min(int(end_text), end)
+        else:
+            suffix = int(end_text)
+            if suffix <= 0:
+                raise _RangeNotSatisfiable()
+            start, end = max(0, length - suffix), length - 1
+    except ValueError:
+        return None
+    if start < 0 or start >= length:
+        raise _RangeNotSatisfiable()
+    return start, end
+
+
+def _etag_matches(header, etag):
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
+
+
+def _eml_response(eml, headers):
+    """
+    stream an EmlFile, honoring If-None-Match (304), Range (206 / 416) and If-Range
+
+    The ETag is the sha256 of the raw EML, or the file id for files stored
+    before hashes were recorded (a changed EML always gets a new file).
+    """
+    etag = f'"{eml.sha256 or eml.file_id}"'
+    cache_headers = {"ETag": etag, "Accept-Ranges": "bytes"}
+
+    if _etag_matches(headers.get("if-none-match"), etag):
+        eml.close()
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=cache_headers)
+
+    byte_range = None
+    if_range = headers.get("if-range")
+    if not if_range or if_range.strip() == etag:
+        try:
+            byte_range = _parse_range(headers.get("range"), eml.length)
+        except _RangeNotSatisfiable:
+            eml.close()
+            return Response(
+                status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+                headers={**cache_headers, "Content-Range": f"bytes */{eml.length}"},
+            )
+
+    if byte_range is None:
+        return StreamingResponse(
+            _aiter_file(eml),
+            media_type="message/rfc822",
+            headers={**cache_headers, "Content-Length": str(eml.length)},
+        )
+
+    start, end = byte_range
+    return StreamingResponse(
+        _aiter_file(eml, start, end - start + 1),
+        status_code=status.HTTP_206_PARTIAL_CONTENT,
+        media_type="message/rfc822",
+        headers={
+            **cache_headers,
+            "Content-Range": f"bytes {start}-{end}/{eml.length}",
+            "Content-Length": str(end - start + 1),
+        },
+    )
+
+
+def _sse_message(event_type, data, event_id=None):
+    lines = [f"id: {event_id}"] if event_id is not None else []
+    lines += [f"event: {event_type}", f"data: {json.dumps(jsonable_encoder(data))}"]
+    return "\n".join(lines) + "\n\n"
+
+
+async def _change_events(request, tenant, after):
+    """SSE stream of a tenant's change feed, starting after sequence `after`"""
+    change_feed = mail_service.change_feed
+    yield f"retry: {SSE_RETRY_MILLISECONDS}\n\n"
+    if after is not None:
+        first = await asyncio.to_thread(change_feed.first_retained, tenant)
+        last = await asyncio.to_thread(change_feed.last_seq, tenant)
+        if (first is not None and first > after + 1) or (first is None and last > after):
+            # the events right after the cursor expired, the client must re-read its state
+            yield _sse_message("reset", {"after": after, "first_retained": first})
+    async for event in change_feed.subscribe(tenant, after, heartbeat=SSE_HEARTBEAT_SECONDS):
+        if await request.is_disconnected():
+            break
+        if event is None:
+            yield ": keep-alive\n\n"
+            continue
+        yield _sse_message(event["type"], event, event_id=event["seq"])
+
+
+def _paginated_response(documents, limit, cursor=lambda document: document["_id"]):
+    """
+    without limit, stream every document; otherwise return a single page
+    and put the cursor of the next page in the `X-Next-Cursor` header
+    """
+    if limit is None:
+        return StreamingResponse(
+            _stream_json_array(documents), media_type="application/json"
+        )
+
+    page = list(documents)
+    headers = {}
+    if len(page) == limit:
+        headers[NEXT_CURSOR_HEADER] = cursor(page[-1])
+    return JSONResponse(content=jsonable_encoder(page), headers=headers)
 
 
 async def get_graph_client(tenant_id):
     tenant_service = TenantService(tenant_id)
-    client_ID = tenant_service.getTenantAppId()
-    client_secret = tenant_service.getTenantAppSecret()
+    client_ID, client_secret = tenant_service.getTenantCredentials()
     graph_clinet = await auth_service.get_graph_client(
         tenant_id, client_ID, client_secret
     )
     return graph_clinet
 
 
+async def sync_tenant(tenant):
+    if await asyncio.to_thread(onboarding_service.is_onboarding, job_manager, tenant):
+        logger.info(f"Tenant {tenant} is onboarding, sync skipped")
+        return
+    tenant_id = UUIDBase62Cipher.decode(tenant)
+    if full_sync_flight.in_flight(tenant_id):
+        # the full resync fetches every mailbox and stores fresh delta links
+        logger.info(f"Tenant {tenant} is running a full resync, sync skipped")
+        return
+    with tracer.start_as_current_span("sync.tenant", attributes=span_attributes(tenant=tenant, mode="delta")):
+        data_service.ensure_indexes(tenant)
+        graph_client = await get_graph_client(tenant_id)
+        await mail_service.getLatestMail(graph_client, tenant_id)
+    metrics.sync_lag.tenant_synced(tenant)
+
+
+async def full_sync(tenant_id):
+    tenant = _tenant_hash(tenant_id)
+    if sync_scheduler.is_running(tenant):
+        # the periodic sync would fetch and store the same messages concurrently,
+        # its next rounds skip the tenant while this resync is in flight
+        logger.info(f"Tenant {tenant} is syncing, full resync waits for it")
+        await sync_scheduler.wait_idle(tenant)
+    with tracer.start_as_current_span("sync.tenant", attributes=span_attributes(tenant=tenant, mode="full")):
+        graph_client = await get_graph_client(tenant_id)
+        return await mail_service.getMail(graph_client, tenant_id)
+
+
+async def _owned_tenants():
+    """tenants this process is responsible for, all of them unless sharded"""
+    tenants = data_service.list_tenants()
+    if lease_manager is None:
+        return tenants
+    busy = [tenant for tenant in tenants if sync_scheduler.is_running(tenant)]
+    return await asyncio.to_thread(lease_manager.claim, tenants, busy)
+
+
+async def _is_leader():
+    """whether this process runs jobs that are not split by tenant"""
+    if lease_manager is None:
+        return True
+    return await asyncio.to_thread(lease_manager.is_leader)
+
+
+@metrics.timed_cron("sync_heartbeat")
+async def sync_heartbeat_cron():
+    await asyncio.to_thread(lease_manager.heartbeat)
+
+
+@metrics.timed_cron("sync")
 async def sync_data_cron():
-    db_names = data_service.client.list_database_names()
-    tenants = [database for database in db_names if database not in ["admin", "config", "local"]]
+    tenants = await _owned_tenants()
+    summary = await sync_scheduler.run_round(tenants, sync_tenant)
+    logger.info(
+        f"Task is running at {datetime.now()}, "
+        f"{summary.get('ok', 0)} ok, {summary.get('failed', 0)} failed, "
+        f"{summary.get('running', 0)} still running in {summary['seconds']}s"
+    )
+
+
+@metrics.timed_cron("eml_sweep")
+async def sweep_orphan_emls_cron():
+    tenants = await _owned_tenants()
     for tenant in tenants:
-        tenant_id = UUIDBase62Cipher.decode(tenant)
-        graph_client = await get_graph_client(tenant_id)
-        latest_mail = await mail_service.getLatestMail(graph_client, tenant_id)
-    logger.info(f"Task is running at {datetime.now()}")
+        try:
+            await asyncio.to_thread(data_service.sweep_orphan_emls, tenant)
+        except Exception as e:
+            logger.error(f"Error occurred sweeping orphaned EMLs of {tenant}: {e}")
+    if await _is_leader():
+        await asyncio.to_thread(data_service.sweep_dangling_chunks)
+    logger.info(f"EML sweep finished at {datetime.now()}")
 
 
-async def get_user_list_API(tenant_id):
-    tenant_service = TenantService(tenant_id)
-    hash_tid = tenant_service.getTenantHashed()
+@metrics.timed_cron("retention")
+async def retention_cron():
+    tenants = await _owned_tenants()
+    for tenant in tenants:
+        try:
+            await retention_service.purge_tenant(tenant)
+        except Exception as e:
+            logger.error(f"Error occurred purging {tenant}: {e}")
+    logger.info(f"Retention run finished at {datetime.now()}")
+
+
+def _tenant_hash(tenant_id):
+    """storage key of a tenant, without the keyring work of a TenantService"""
+    return UUIDBase62Cipher.encode(tenant_id)
+
+
+def _existing_tenant_hash(tenant_id):
+    """storage key of an onboarded tenant, 404 otherwise (nothing is created for unknown ids)"""
+    tenant = _tenant_hash(tenant_id)
+    if not data_service.is_database_exists(tenant):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Tenant {tenant_id} not found.")
+    return tenant
+
+
+async def get_user_list_API(tenant_id, limit=None, after=None):
+    hash_tid = _tenant_hash(tenant_id)
     collection_user = Collection.USER
-    query = {}
-    user_list = data_service.read(hash_tid, collection_user, query)
-    logger.info(user_list)
+    query = _keyset_query({}, after)
+    user_list = data_service.find(
+        hash_tid,
+        collection_user,
+        query,
+        sort=[("_id", 1)],
+        limit=limit or 0,
+        route=ReadRoute.SECONDARY,
+    )
     return user_list
 
 
-async def get_user_mails_API(tenant_id, user_id):
-    graph_client = await get_graph_client(tenant_id)
-    tenant_service = TenantService(tenant_id)
-    hash_tid = tenant_service.getTenantHashed()
+async def get_user_mails_API(
+    tenant_id, user_id, projection=None, limit=None, after=None, route=ReadRoute.PRIMARY
+):
+    hash_tid = _tenant_hash(tenant_id)
     collection_mail = Collection.MAIL
-    query = {"user_id": user_id}
-    mails = data_service.read(hash_tid, collection_mail, query)
+    query = _keyset_query({"user_id": user_id}, after)
+    mails = data_service.find(
+        hash_tid,
+        collection_mail,
+        query,
+        projection=projection,
+        sort=[("_id", 1)],
+        limit=limit or 0,
+        route=route,
+    )
     return mails
 
 
-async def get_all_users(tenant_id):
-    user_list = await get_user_list_API(tenant_id)
+def _search_query(
+    user_id=None, q=None, sender=None, received_from=None, received_to=None, attachment=None, deleted=None
+):
+    """mail search filters, each one backed by an index from dataService.TENANT_INDEXES"""
+    query = {}
+    if user_id:
+        query["user_id"] = user_id
+    if q:
+        query["$text"] = {"$search": q}
+    if sender:
+        query["sender"] = sender.lower()
+    if received_from or received_to:
+        query["received_at"] = {}
+        if received_from:
+            query["received_at"]["$gte"] = received_from
+        if received_to:
+            query["received_at"]["$lt"] = received_to
+    if attachment:
+        # anchored, so the attachments.name index is used as a prefix range
+        query["attachments.name"] = {"$regex": "^" + re.escape(attachment)}
+    if deleted is not None:
+        query["is_deleted"] = True if deleted else {"$ne": True}
+    return query
+
+
+async def search_mails_API(tenant_id, filters, limit, after=None):
+    query = _search_keyset_query(_search_query(**filters), after)
+    return data_service.find(
+        _tenant_hash(tenant_id),
+        Collection.MAIL,
+        query,
+        projection=MAIL_LIST_PROJECTION,
+        sort=[("received_at", -1), ("_id", -1)],
+        limit=limit,
+        route=ReadRoute.SECONDARY,
+    )
+
+
+async def get_all_users(tenant_id, limit=None, after=None):
+    user_list = await get_user_list_API(tenant_id, limit=limit, after=after)
     return user_list
 
 
 async def get_specific_user(tenant_id, user_id):
-    user_list = await get_user_list_API(tenant_id)
-    for user in user_list:
-        if user.get("id") == user_id:
-            return user
-    return None
+    user = data_service.find_one(_tenant_hash(tenant_id), Collection.USER, {"id": user_id})
+    if user is None:
+        raise auth_service.UserNotFoundError(f"User {user_id} not found.")
+    return user
 
 
-async def get_user_all_mail(tenant_id, user_id):
-    user_mails = await get_user_mails_API(tenant_id, user_id)
+async def get_user_all_mail(tenant_id, user_id, limit=None, after=None):
+    user_mails = await get_user_mails_API(
+        tenant_id,
+        user_id,
+        projection=MAIL_LIST_PROJECTION,
+        limit=limit,
+        after=after,
+        route=ReadRoute.SECONDARY,
+    )
     return user_mails
 
 
 async def get_specific_mail(tenant_id, user_id, message_id):
-    user_mails = await get_user_mails_API(tenant_id, user_id)
-    for mail in user_mails:
-        if mail.get("message_id") == message_id:
-            return mail
-    return None
-
-async def get_specific_eml(tenant_id, user_id, message_id):
-    user_mails = await get_user_mails_API(tenant_id, user_id)
-    for mail in user_mails:
-        if mail.get("message_id") == message_id:
-            tenant_service = TenantService(tenant_id)
-            hash_tid = tenant_service.getTenantHashed()
-            fs = data_service.get_gridfs(hash_tid)
-            cursor = fs.find({"filename": f"{message_id}.eml"})
-            for eml in cursor:
-                content = eml.read()
-                from fastapi.responses import Response
-                return Response(content, media_type="message/rfc822")
-    return None
+    mail = data_service.find_one(
+        _tenant_hash(tenant_id),
+        Collection.MAIL,
+        {"user_id": user_id, "message_id": message_id},
+    )
+    if mail is None:
+        raise auth_service.MailNotFoundError(f"Mail {message_id} not found.")
+    return mail
+
+
+async def get_specific_eml(tenant_id, user_id, message_id, headers):
+    hash_tid = _tenant_hash(tenant_id)
+    mail = data_service.find_one(
+        hash_tid,
+        Collection.MAIL,
+        {"user_id": user_id, "message_id": message_id},
+        projection={"eml_file_id": 1},
+        route=ReadRoute.SECONDARY,
+    )
+    reader = None
+    if mail and mail.get("eml_file_id"):
+        reader = data_service.open_eml(
+            hash_tid, message_id, route=ReadRoute.SECONDARY, eml_file_id=mail["eml_file_id"]
+        )
+    if reader is None:
+        raise auth_service.MailNotFoundError(f"EML of mail {message_id} not found.")
+    return _eml_response(reader, headers)
 # change end
 
 
-@router.post("/init", response_model=SuccessResponse)
+def _start_onboarding(job_id, graph_client, tenant_id):
+    return lambda: onboarding_service.onboard_tenant(job_manager, job_id, graph_client, tenant_id)
+
+
+@router.post("/init", response_model=SuccessResponse, status_code=status.HTTP_202_ACCEPTED)
 async def init_tenant(credentials: TenantCredentials = Body(...)):
-    """Initializes a new tenant, fetches all user and mail data, and saves it."""
+    """Initializes a new tenant and starts an onboarding job fetching its users and mails."""
     try:
-        await auth_service.auth_init_tenant(
+        graph_client = await auth_service.auth_init_tenant(
             credentials.tenant_id, credentials.client_id, credentials.client_secret
         )
+        job = job_manager.create(onboarding_service.ONBOARDING_JOB, credentials.tenant_id)
+        job_manager.start(job["_id"], _start_onboarding(job["_id"], graph_client, credentials.tenant_id))
         return SuccessResponse(
-            message=f"Tenant {credentials.tenant_id} initialized successfully."
+            message=f"Tenant {credentials.tenant_id} initialized, onboarding started.",
+            data={"job_id": job["_id"]},
         )
     except auth_service.AlreadyInitializedError as e:
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
@@ -164,12 +592,22 @@ async def update_tenant(credentials: TenantCredentials = Body(...)):
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
 
+@router.get("/sync/stats")
+async def get_sync_stats():
+    """Retrieves the last sync round summary and per-tenant sync timings."""
+    stats = sync_scheduler.stats()
+    stats["full_sync"] = full_sync_flight.stats()
+    stats["graph_clients"] = auth_service.credential_manager.stats()
+    if lease_manager is not None:
+        stats["worker"] = await asyncio.to_thread(lease_manager.stats)
+    return stats
+
+
 @router.get("/{tenant_id}/mails")
 async def get_mails(tenant_id: str = Path(..., description="The ID of the tenant")):
-    """Retrieves the list of all users for a given tenant from local storage."""
+    """Resyncs every mailbox of a tenant, concurrent calls share one resync and its result."""
     try:
-        graph_client = await get_graph_client(tenant_id)
-        mails = await mail_service.getMail(graph_client, tenant_id)
+        mails = await full_sync_flight.do(tenant_id, full_sync, tenant_id)
         return mails
     except auth_service.TenantNotFoundError as e:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
@@ -178,12 +616,219 @@ async def get_mails(tenant_id: str = Path(..., description="The ID of the tenant
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
 
+@router.get("/{tenant_id}/mails/search")
+async def search_mails(
+    tenant_id: str = Path(..., description="The ID of the tenant"),
+    user_id: str | None = Query(None, description="Only mails of this user"),
+    q: str | None = Query(None, description="Words or \"phrase\" in the subject (text search)"),
+    sender: str | None = Query(None, description="Sender address, case-insensitive"),
+    received_from: datetime | None = Query(None, description="Received at or after (ISO 8601)"),
+    received_to: datetime | None = Query(None, description="Received before (ISO 8601)"),
+    attachment: str | None = Query(None, description="Attachment name prefix"),
+    deleted: bool | None = Query(None, description="Only deleted (true) or only live (false) mails"),
+    limit: int = Query(SEARCH_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE, description="Page size"),
+    after: str | None = Query(None, description="Cursor from the X-Next-Cursor header"),
+):
+    """Searches the stored mail metadata of a tenant, newest received first, keyset paginated."""
+    filters = {
+        "user_id": user_id,
+        "q": q,
+        "sender": sender,
+        "received_from": received_from,
+        "received_to": received_to,
+        "attachment": attachment,
+        "deleted": deleted,
+    }
+    try:
+        mails = await search_mails_API(tenant_id, filters, limit, after)
+        return _paginated_response(mails, limit, cursor=_search_cursor)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error occurred in search_mails: {e}", exc_info=True)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
+
+@router.get("/{tenant_id}/events")
+async def stream_events(
+    request: Request,
+    tenant_id: str = Path(..., description="The ID of the tenant"),
+    after: int | None = Query(
+        None, ge=0, description="Sequence number to resume after, Last-Event-ID takes precedence"
+    ),
+):
+    """Streams created, updated and deleted mail events of a tenant as Server-Sent Events."""
+    last_event_id = request.headers.get("last-event-id")
+    if last_event_id:
+        try:
+            after = int(last_event_id)
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid Last-Event-ID: {last_event_id}"
+            )
+
+    tenant = _existing_tenant_hash(tenant_id)
+    return StreamingResponse(
+        _change_events(request, tenant, after),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/{tenant_id}/retention")
+async def get_retention(tenant_id: str = Path(..., description="The ID of the tenant")):
+    """Retrieves the retention policy of a tenant."""
+    try:
+        hash_tid = _existing_tenant_hash(tenant_id)
+        return retention_service.get_retention_policy(hash_tid)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error occurred in get_retention: {e}", exc_info=True)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
+
+@router.put("/{tenant_id}/retention")
+async def update_retention(
+    tenant_id: str = Path(..., description="The ID of the tenant"),
+    policy: RetentionPolicy = Body(...),
+):
+    """Updates the retention policy of a tenant."""
+    try:
+        hash_tid = _existing_tenant_hash(tenant_id)
+        return retention_service.set_retention_policy(hash_tid, **policy.model_dump())
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error occurred in update_retention: {e}", exc_info=True)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
+
+@router.post("/{tenant_id}/retention/run")
+async def run_retention(tenant_id: str = Path(..., description="The ID of the tenant")):
+    """Applies the retention policy of a tenant now and reports what was reclaimed."""
+    try:
+        hash_tid = _existing_tenant_hash(tenant_id)
+        return await retention_service.purge_tenant(hash_tid)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error occurred in run_retention: {e}", exc_info=True)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
+
+@router.post("/{tenant_id}/remediation", status_code=status.HTTP_202_ACCEPTED)
+async def start_remediation(
+    tenant_id: str = Path(..., description="The ID of the tenant"),
+    request: RemediationRequest = Body(...),
+):
+    """Starts a background job deleting many mails or attachments, returns its job ID."""
+    if not (request.targets or request.internet_message_id or request.subject):
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Provide targets, internet_message_id or subject.",
+        )
+    try:
+        graph_client = await get_graph_client(tenant_id)
+        criteria = {
+            "targets": [target.model_dump() for target in request.targets],
+            "internet_message_id": request.internet_message_id,
+            "subject": request.subject,
+        }
+        job = job_manager.create("remediation", tenant_id, params=criteria)
+        job_manager.start(
+            job["_id"],
+            lambda: remediation_service.remediate(job_manager, job["_id"], graph_client, tenant_id, **criteria),
+        )
+        return {"job_id": job["_id"], "status": job["status"]}
+    except auth_service.TenantNotFoundError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    except auth_service.GraphAPIError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error occurred in start_remediation: {e}", exc_info=True)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
+
+@router.get("/{tenant_id}/jobs/{job_id}")
+async def get_job(
+    tenant_id: str = Path(..., description="The ID of the tenant"),
+    job_id: str = Path(..., description="The ID of the job"),
+):
+    """Retrieves the status and progress counters of a background job."""
+    try:
+        return await asyncio.to_thread(job_manager.get, job_id, tenant_id)
+    except JobNotFoundError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+
+
+@router.post("/{tenant_id}/jobs/{job_id}/cancel")
+async def cancel_job(
+    tenant_id: str = Path(..., description="The ID of the tenant"),
+    job_id: str = Path(..., description="The ID of the job"),
+):
+    """Cancels a pending or running background job, finished items are kept."""
+    try:
+        return job_manager.cancel(job_id, tenant_id)
+    except JobNotFoundError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    except JobStateError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+
+
+@router.post("/{tenant_id}/jobs/{job_id}/resume")
+async def resume_job(
+    tenant_id: str = Path(..., description="The ID of the tenant"),
+    job_id: str = Path(..., description="The ID of the job"),
+):
+    """Resumes a cancelled, failed or interrupted onboarding job, skipping the mailboxes already done."""
+    try:
+        job = job_manager.get(job_id, tenant_id)
+        if job["kind"] != onboarding_service.ONBOARDING_JOB:
+            raise JobStateError(f"{job['kind']} jobs cannot be resumed.")
+        graph_client = await get_graph_client(tenant_id)
+        return job_manager.resume(job_id, _start_onboarding(job_id, graph_client, tenant_id), tenant_id)
+    except JobNotFoundError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    except JobStateError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    except auth_service.GraphAPIError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error occurred in resume_job: {e}", exc_info=True)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
+
+@router.get("/{tenant_id}/jobs/{job_id}/items")
+async def get_job_items(
+    tenant_id: str = Path(..., description="The ID of the tenant"),
+    job_id: str = Path(..., description="The ID of the job"),
+    item_status: str | None = Query(None, alias="status", description="Only items with this status (done, failed)"),
+    limit: int = Query(JOB_ITEMS_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE, description="Page size"),
+    after: int = Query(-1, description="Index of the last item of the previous page"),
+):
+    """Retrieves per-item results of a background job, in item order."""
+    try:
+        await asyncio.to_thread(job_manager.get, job_id, tenant_id)
+        return await asyncio.to_thread(job_manager.items, job_id, item_status, limit, after)
+    except JobNotFoundError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+
+
 @router.get("/{tenant_id}/users")
-async def get_users(tenant_id: str = Path(..., description="The ID of the tenant")):
+async def get_users(
+    tenant_id: str = Path(..., description="The ID of the tenant"),
+    limit: int | None = Query(None, ge=1, le=MAX_PAGE_SIZE, description="Page size, omit to stream all users"),
+    after: str | None = Query(None, description="Cursor returned in the X-Next-Cursor header of the previous page"),
+):
     """Retrieves the list of all users for a given tenant from local storage."""
     try:
-        users = await get_all_users(tenant_id)
-        return users
+        users = await get_all_users(tenant_id, limit=limit, after=after)
+        return _paginated_response(users, limit)
+    except HTTPException:
+        raise
     except auth_service.TenantNotFoundError as e:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
     except Exception as e:
@@ -211,11 +856,15 @@ async def get_user(
 async def get_user_mails(
     tenant_id: str = Path(..., description="The ID of the tenant"),
     user_id: str = Path(..., description="The ID of the user (GUID)"),
+    limit: int | None = Query(None, ge=1, le=MAX_PAGE_SIZE, description="Page size, omit to stream all mails"),
+    after: str | None = Query(None, description="Cursor returned in the X-Next-Cursor header of the previous page"),
 ):
-    """Retrieves all emails for a specific user from local storage."""
+    """Retrieves all emails (without change history) for a specific user from local storage."""
     try:
-        mails = await get_user_all_mail(tenant_id, user_id)
-        return mails
+        mails = await get_user_all_mail(tenant_id, user_id, limit=limit, after=after)
+        return _paginated_response(mails, limit)
+    except HTTPException:
+        raise
     except (auth_service.TenantNotFoundError, auth_service.UserNotFoundError) as e:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
     except Exception as e:
@@ -241,19 +890,20 @@ async def get_mail(
 
 
 @router.get("/{tenant_id}/users/{user_id}/mails/{message_id}/eml")
-async def get_mail(
+async def get_mail_eml(
+    request: Request,
     tenant_id: str = Path(..., description="The ID of the tenant"),
     user_id: str = Path(..., description="The ID of the user (GUID)"),
     message_id: str = Path(..., description="The ID of the email message to retrieve"),
 ):
-    """Retrieves data for a single, specific email from local storage."""
+    """Streams the raw EML of an email from local storage, supports Range, ETag and If-None-Match."""
     try:
-        mail = await get_specific_eml(tenant_id, user_id, message_id)
-        return mail
+        eml = await get_specific_eml(tenant_id, user_id, message_id, request.headers)
+        return eml
     except (auth_service.TenantNotFoundError, auth_service.MailNotFoundError) as e:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
     except Exception as e:
-        logger.error(f"Error occurred in get_mail: {e}", exc_info=True)
+        logger.error(f"Error occurred in get_mail_eml: {e}", exc_info=True)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
 
@@ -374,4 +1024,5 @@ async def delete_database(tenant_id: str):
 
     tenant_service = TenantService(tenant_id)
     tenant_service.delete()
+    await auth_service.credential_manager.invalidate(tenant_id)
     return {"ok": True}
@@ -0,0 +1,88 @@
+"""
+Per-process cache of tenant secrets (AES keys, decrypted app credentials).
+
+Values are held as bytearrays and overwritten with zeros when they are
+evicted, expire (SECRET_CACHE_TTL_SECONDS) or are invalidated, so a secret
+does not stay in process memory longer than it is cached. Strings handed to
+callers (e.g. the client secret passed to azure-identity) are out of reach.
+
+Usage:
+    cache = SecretCache()
+    key = cache.get_or_load(tenant_hash, load_key)   # load_key() -> bytes
+    cache.invalidate(tenant_hash)
+"""
+
+import os
+import threading
+
+from cachetools import TTLCache
+
+SECRET_CACHE_TTL_SECONDS = int(os.getenv("SECRET_CACHE_TTL_SECONDS", "300"))
+SECRET_CACHE_SIZE = int(os.getenv("SECRET_CACHE_SIZE", "4096"))
+
+
+def _zero(value) -> None:
+    if isinstance(value, bytearray):
+        value[:] = bytes(len(value))
+    elif isinstance(value, tuple):
+        for part in value:
+            _zero(part)
+
+
+class _ZeroingTTLCache(TTLCache):
+    """TTLCache that zeroes every value it drops"""
+
+    def popitem(self):
+        key, value = super().popitem()
+        _zero(value)
+        return key, value
+
+    def expire(self, time=None):
+        expired = super().expire(time)
+        for _, value in expired:
+            _zero(value)
+        return expired
+
+
+class SecretCache:
+    def __init__(self, maxsize: int = SECRET_CACHE_SIZE, ttl: int = SECRET_CACHE_TTL_SECONDS):
+        self._cache = _ZeroingTTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+
+    def get_or_load(self, key, load):
+        """
+        cached value of `key`, or load() stored as a bytearray (a tuple of
+        bytes becomes a tuple of bytearrays); None is not cached
+
+        Returns an immutable copy, the cached value may be zeroed at any time.
+        """
+        with self._lock:
+            value = self._cache.get(key)
+            if value is not None:
+                return _copy(value)
+
+        loaded = load()
+        if loaded is None:
+            return None
+        value = tuple(bytearray(part) for part in loaded) if isinstance(loaded, tuple) else bytearray(loaded)
+        with self._lock:
+            previous = self._cache.pop(key, None)
+            self._cache[key] = value
+        _zero(previous)
+        return _copy(value)
+
+    def invalidate(self, key) -> None:
+        with self._lock:
+            value = self._cache.pop(key, None)
+        _zero(value)
+
+    def clear(self) -> None:
+        with self._lock:
+            # MutableMapping.clear() drops items through popitem()
+            self._cache.clear()
+
+
+def _copy(value):
+    if isinstance(value, tuple):
+        return tuple(bytes(part) for part in value)
+    return bytes(value)
@@ -0,0 +1,54 @@
+"""
+Single-flight call coalescing.
+
+Concurrent calls with the same key share one execution: the first caller
+starts the coroutine, the others await the same task and get the same
+result (or exception). A caller that goes away (e.g. a closed HTTP request)
+does not cancel the work for the others.
+
+Usage:
+    flight = SingleFlight("full_sync")
+    result = await flight.do(tenant_id, getMail, client, tenant_id)
+"""
+
+import asyncio
+
+from common.constants import LogLevel
+from logger.operationLogger import OperationLogger
+
+logger = OperationLogger()
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._calls = {}
+        self._started = 0
+        self._coalesced = 0
+
+    def in_flight(self, key) -> bool:
+        return key in self._calls
+
+    def _forget(self, key, task) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+
+    async def do(self, key, fn, *args, **kwargs):
+        """await fn(*args, **kwargs), or the call already running for `key`"""
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn(*args, **kwargs))
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+            self._started += 1
+        else:
+            self._coalesced += 1
+            logger.log(LogLevel.INFO, "SingleFlight", "joined call in flight", name=self.name, key=key)
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": sorted(str(key) for key in self._calls),
+            "started": self._started,
+            "coalesced": self._coalesced,
+        }
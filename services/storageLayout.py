@@ -0,0 +1,187 @@
+"""
+Storage layouts decide where the data of a tenant lives.
+
+- database: one database per tenant (the database name is the encrypted tenant ID)
+- shared:   every tenant in the same collections of one shared database, each
+            document carries a `tenant_id` field and every index starts with it
+
+Usage:
+    from services.storageLayout import get_storage_layout
+    layout = get_storage_layout()          # from STORAGE_LAYOUT, default "database"
+    layout = get_storage_layout("shared")
+
+MongoDataService routes every query, document and index through the layout,
+callers keep passing the encrypted tenant ID as before.
+"""
+
+import os
+from typing import Any, Dict, List, Tuple
+
+from pymongo import MongoClient
+from pymongo.database import Database
+
+from common.constants import Collection
+
+STORAGE_LAYOUT = os.getenv("STORAGE_LAYOUT", "database")
+SHARED_DB_NAME = os.getenv("SHARED_DB_NAME", "inbox_connector_db")
+TENANT_KEY = "tenant_id"
+SYSTEM_DATABASES = {"admin", "config", "local"}
+GRIDFS_DELETE_BATCH_SIZE = 1000
+
+
+class DatabasePerTenantLayout:
+    """one database per tenant, documents are stored as-is"""
+
+    name = "database"
+
+    def database(self, client: MongoClient, tenant_id: str) -> Database:
+        return client[tenant_id]
+
+    def scope_query(
+        self, tenant_id: str, collection_type: str, query: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        return query
+
+    def scope_document(
+        self, tenant_id: str, collection_type: str, document: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        return document
+
+    def unscope_document(
+        self, tenant_id: str, collection_type: str, document: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        return document
+
+    def index_keys(
+        self, collection_type: str, keys: List[Tuple[str, Any]]
+    ) -> List[Tuple[str, Any]]:
+        return keys
+
+    def index_scope(self, tenant_id: str) -> str:
+        """indexes are created once per returned scope"""
+        return tenant_id
+
+    def tenant_exists(self, client: MongoClient, tenant_id: str) -> bool:
+        return tenant_id in client.list_database_names()
+
+    def list_tenants(self, client: MongoClient) -> List[str]:
+        return [
+            name
+            for name in client.list_database_names()
+            if name not in SYSTEM_DATABASES and name != SHARED_DB_NAME
+        ]
+
+    def drop_tenant(self, client: MongoClient, tenant_id: str) -> None:
+        client.drop_database(tenant_id)
+
+    def gridfs_databases(self, client: MongoClient) -> List[Database]:
+        return [client[tenant_id] for tenant_id in self.list_tenants(client)]
+
+
+class SharedCollectionLayout:
+    """
+    all tenants in the collections of one database, keyed by `tenant_id`
+
+    GridFS files keep the key in `metadata.tenant_id`, chunks are reached
+    through their file. String `_id`s (e.g. the info "singleton") are
+    prefixed with the tenant so they stay unique across tenants.
+    """
+
+    name = "shared"
+
+    def __init__(self, db_name: str = SHARED_DB_NAME):
+        self.db_name = db_name
+
+    @staticmethod
+    def _tenant_field(collection_type: str) -> str:
+        if collection_type == Collection.FS_FILES:
+            return f"metadata.{TENANT_KEY}"
+        return TENANT_KEY
+
+    @staticmethod
+    def _id_prefix(tenant_id: str) -> str:
+        return f"{tenant_id}:"
+
+    def database(self, client: MongoClient, tenant_id: str) -> Database:
+        return client[self.db_name]
+
+    def scope_query(
+        self, tenant_id: str, collection_type: str, query: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        scoped = dict(query)
+        scoped[self._tenant_field(collection_type)] = tenant_id
+        if isinstance(scoped.get("_id"), str):
+            scoped["_id"] = self._id_prefix(tenant_id) + scoped["_id"]
+        return scoped
+
+    def scope_document(
+        self, tenant_id: str, collection_type: str, document: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        if collection_type == Collection.FS_FILES:
+            document.setdefault("metadata", {})[TENANT_KEY] = tenant_id
+        else:
+            document[TENANT_KEY] = tenant_id
+        if isinstance(document.get("_id"), str):
+            document["_id"] = self._id_prefix(tenant_id) + document["_id"]
+        return document
+
+    def unscope_document(
+        self, tenant_id: str, collection_type: str, document: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        if collection_type == Collection.FS_FILES:
+            document.get("metadata", {}).pop(TENANT_KEY, None)
+        else:
+            document.pop(TENANT_KEY, None)
+        prefix = self._id_prefix(tenant_id)
+        if isinstance(document.get("_id"), str) and document["_id"].startswith(prefix):
+            document["_id"] = document["_id"][len(prefix):]
+        return document
+
+    def index_keys(
+        self, collection_type: str, keys: List[Tuple[str, Any]]
+    ) -> List[Tuple[str, Any]]:
+        return [(self._tenant_field(collection_type), 1)] + keys
+
+    def index_scope(self, tenant_id: str) -> str:
+        return self.db_name
+
+    def tenant_exists(self, client: MongoClient, tenant_id: str) -> bool:
+        info = client[self.db_name][Collection.INFO]
+        return info.count_documents({TENANT_KEY: tenant_id}, limit=1) > 0
+
+    def list_tenants(self, client: MongoClient) -> List[str]:
+        return client[self.db_name][Collection.INFO].distinct(TENANT_KEY)
+
+    def drop_tenant(self, client: MongoClient, tenant_id: str) -> None:
+        db = client[self.db_name]
+        files = db[Collection.FS_FILES]
+        file_query = {self._tenant_field(Collection.FS_FILES): tenant_id}
+        while True:
+            file_ids = [
+                doc["_id"]
+                for doc in files.find(file_query, {"_id": 1}).limit(GRIDFS_DELETE_BATCH_SIZE)
+            ]
+            if not file_ids:
+                break
+            db[Collection.FS_CHUNKS].delete_many({"files_id": {"$in": file_ids}})
+            files.delete_many({"_id": {"$in": file_ids}})
+
+        for collection_type in (Collection.USER, Collection.MAIL, Collection.ATT, Collection.INFO):
+            db[collection_type].delete_many({TENANT_KEY: tenant_id})
+
+    def gridfs_databases(self, client: MongoClient) -> List[Database]:
+        return [client[self.db_name]]
+
+
+LAYOUTS = {
+    DatabasePerTenantLayout.name: DatabasePerTenantLayout,
+    SharedCollectionLayout.name: SharedCollectionLayout,
+}
+
+
+def get_storage_layout(name: str = None):
+    """return the layout registered under `name`, defaults to STORAGE_LAYOUT"""
+    name = name or STORAGE_LAYOUT
+    if name not in LAYOUTS:
+        raise ValueError(f"unknown storage layout: {name}, expected one of {list(LAYOUTS)}")
+    return LAYOUTS[name]()
@@ -0,0 +1,182 @@
+"""
+Tenant-level sync scheduler.
+
+Every round dispatches one sync task per tenant:
+    - at most SYNC_CONCURRENCY tenants sync at the same time
+    - the start order rotates every round, so the same tenants are not always last
+    - a failing or timing out tenant only fails its own task
+    - a tenant has at most one sync in flight; when a round finds one still
+      running, SYNC_OVERLAP_POLICY decides: "skip" it, or "queue" one more
+      run right after the current one
+    - a round waits at most SYNC_ROUND_TIMEOUT_SECONDS, slower tenants keep
+      running in the background and are reported as "running"
+
+Usage:
+    scheduler = TenantSyncScheduler()
+    summary = await scheduler.run_round(tenants, sync)   # sync: async def sync(tenant)
+    await scheduler.wait_idle(tenant)                    # e.g. before a full resync
+    scheduler.stats()
+"""
+
+import asyncio
+import os
+import time
+from datetime import datetime, timezone
+
+from common.constants import LogLevel
+from logger.operationLogger import OperationLogger
+
+SYNC_CONCURRENCY = int(os.getenv("SYNC_CONCURRENCY", "4"))
+SYNC_OVERLAP_POLICY = os.getenv("SYNC_OVERLAP_POLICY", "skip")
+SYNC_TENANT_TIMEOUT_SECONDS = int(os.getenv("SYNC_TENANT_TIMEOUT_SECONDS", "1800"))
+SYNC_ROUND_TIMEOUT_SECONDS = int(os.getenv("SYNC_ROUND_TIMEOUT_SECONDS", "240"))
+OVERLAP_POLICIES = ("skip", "queue")
+
+logger = OperationLogger()
+
+
+class TenantSyncScheduler:
+    def __init__(
+        self,
+        concurrency: int = SYNC_CONCURRENCY,
+        overlap_policy: str = SYNC_OVERLAP_POLICY,
+        tenant_timeout: float = SYNC_TENANT_TIMEOUT_SECONDS,
+        round_timeout: float = SYNC_ROUND_TIMEOUT_SECONDS,
+    ):
+        if overlap_policy not in OVERLAP_POLICIES:
+            raise ValueError(f"overlap_policy must be one of {OVERLAP_POLICIES}")
+        self.concurrency = concurrency
+        self.overlap_policy = overlap_policy
+        self.tenant_timeout = tenant_timeout
+        self.round_timeout = round_timeout
+        self._semaphore = None
+        self._in_flight = {}
+        self._queued = set()
+        self._rotation = 0
+        self._tenant_stats = {}
+        self._last_round = None
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # created on first use, inside the running event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self._semaphore
+
+    def is_running(self, tenant: str) -> bool:
+        return tenant in self._in_flight
+
+    async def wait_idle(self, tenant: str) -> None:
+        """wait until the tenant's sync in flight (and its queued runs) ended, whatever the outcome"""
+        task = self._in_flight.get(tenant)
+        if task is not None:
+            # asyncio.wait does not cancel the sync when the caller is cancelled
+            await asyncio.wait({task})
+
+    def _record(self, tenant: str, status: str, started: float, error: str = None) -> dict:
+        seconds = round(time.monotonic() - started, 3)
+        stats = self._tenant_stats.setdefault(
+            tenant, {"runs": 0, "failures": 0, "total_seconds": 0.0}
+        )
+        stats["runs"] += 1
+        stats["total_seconds"] = round(stats["total_seconds"] + seconds, 3)
+        if status != "ok":
+            stats["failures"] += 1
+        stats["last"] = {
+            "status": status,
+            "seconds": seconds,
+            "finished_at": datetime.now(timezone.utc).isoformat(),
+            "error": error,
+        }
+        return {"tenant": tenant, "status": status, "seconds": seconds, "error": error}
+
+    async def _run_once(self, tenant: str, sync) -> dict:
+        async with self._get_semaphore():
+            started = time.monotonic()
+            try:
+                await asyncio.wait_for(sync(tenant), timeout=self.tenant_timeout)
+                return self._record(tenant, "ok", started)
+            except asyncio.TimeoutError:
+                logger.log(LogLevel.ERROR, "SyncScheduler", "tenant sync timed out", tenant=tenant)
+                return self._record(tenant, "timeout", started, f"exceeded {self.tenant_timeout}s")
+            except Exception as e:
+                logger.log(LogLevel.ERROR, "SyncScheduler", "tenant sync failed", tenant=tenant, error=str(e))
+                return self._record(tenant, "failed", started, str(e))
+
+    async def _run_tenant(self, tenant: str, sync) -> dict:
+        try:
+            result = await self._run_once(tenant, sync)
+            # rounds that found this tenant busy asked for one more run
+            while tenant in self._queued:
+                self._queued.discard(tenant)
+                result = await self._run_once(tenant, sync)
+            return result
+        finally:
+            self._in_flight.pop(tenant, None)
+
+    def _rotate(self, tenants: list) -> list:
+        if not tenants:
+            return []
+        offset = self._rotation % len(tenants)
+        self._rotation += 1
+        return tenants[offset:] + tenants[:offset]
+
+    async def run_round(self, tenants: list, sync) -> dict:
+        """
+        dispatch one sync per tenant and wait for the round
+
+        Args:
+            tenants: tenant keys, in a stable order
+            sync: coroutine function taking a tenant key
+
+        Returns:
+            dict: round summary with per-tenant results
+        """
+        started = time.monotonic()
+        started_at = datetime.now(timezone.utc).isoformat()
+        results = []
+        tasks = {}
+
+        for tenant in self._rotate(sorted(tenants)):
+            if tenant in self._in_flight:
+                if self.overlap_policy == "queue":
+                    self._queued.add(tenant)
+                    results.append({"tenant": tenant, "status": "queued"})
+                else:
+                    results.append({"tenant": tenant, "status": "skipped"})
+                continue
+            task = asyncio.create_task(self._run_tenant(tenant, sync))
+            self._in_flight[tenant] = task
+            tasks[task] = tenant
+
+        if tasks:
+            done, pending = await asyncio.wait(tasks.keys(), timeout=self.round_timeout)
+            results.extend(task.result() for task in done)
+            results.extend({"tenant": tasks[task], "status": "running"} for task in pending)
+
+        summary = {
+            "started_at": started_at,
+            "seconds": round(time.monotonic() - started, 3),
+            "tenants": len(tenants),
+            "concurrency": self.concurrency,
+        }
+        for result in results:
+            summary[result["status"]] = summary.get(result["status"], 0) + 1
+        summary["results"] = results
+        self._last_round = summary
+
+        logger.log(
+            LogLevel.INFO,
+            "SyncScheduler",
+            "round finished",
+            **{k: v for k, v in summary.items() if k != "results"},
+        )
+        return summary
+
+    def stats(self) -> dict:
+        """last round summary, per-tenant counters and what is running now"""
+        return {
+            "last_round": self._last_round,
+            "in_flight": sorted(self._in_flight),
+            "queued": sorted(self._queued),
+            "tenants": self._tenant_stats,
+        }
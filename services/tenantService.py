@@ -6,6 +6,7 @@ from common.cipher import AESCipher, UUIDBase62Cipher
 from common.constants import Collection, LogLevel
 from logger.operationLogger import OperationLogger
 from services.dataService import DataService
+from services.secretCache import SecretCache
 
 KEY_LENGTH = 16
 KEY_NAME = "INOBX_CONNECTOR"
@@ -13,6 +14,9 @@ KEY_NAME = "INOBX_CONNECTOR"
 logger = OperationLogger()
 dataService = DataService()
 mongo_service = dataService.get_data_service()
+keyring.set_keyring(PlaintextKeyring())
+# AES keys and decrypted app credentials, keyed by ("key" | "credentials", tenant hash)
+secret_cache = SecretCache()
 
 
 class TenantService:
@@ -21,14 +25,16 @@ class TenantService:
         try:
             self.__tenant_hash = UUIDBase62Cipher.encode(tenant_id)
             self.__aes_cipher = AESCipher(self._get_aes_key())
-            logger.log(LogLevel.INFO, "TenantService", f"init success")
+            logger.log(LogLevel.DEBUG, "TenantService", "init success")
         except Exception as e:
             logger.log(LogLevel.ERROR, "TenantService", f"init failed: {e}")
             raise
 
     def _get_aes_key(self):
+        return secret_cache.get_or_load(("key", self.__tenant_hash), self._load_aes_key)
+
+    def _load_aes_key(self):
         try:
-            keyring.set_keyring(PlaintextKeyring())
             key_b64 = keyring.get_password(self.__tenant_hash, KEY_NAME)
             if key_b64 is None:
                 key_bytes = get_random_bytes(KEY_LENGTH)
@@ -46,6 +52,8 @@ class TenantService:
             LogLevel.INFO, "TenantService", f"delete database", name=self.__tenant_hash
         )
         mongo_service.delete_database(self.__tenant_hash)
+        secret_cache.invalidate(("credentials", self.__tenant_hash))
+        secret_cache.invalidate(("key", self.__tenant_hash))
 
     def getTenantHashed(self):
         return self.__tenant_hash
@@ -69,7 +77,9 @@ class TenantService:
 
         if data:
             data["_id"] = "singleton"
+            mongo_service.ensure_indexes(self.__tenant_hash)
             mongo_service.create_one(self.__tenant_hash, Collection.INFO, data)
+            secret_cache.invalidate(("credentials", self.__tenant_hash))
             logger.log(
                 LogLevel.INFO,
                 "TenantService",
@@ -90,6 +100,7 @@ class TenantService:
                 {"_id": "singleton"},
                 {"$set": data},
             )
+            secret_cache.invalidate(("credentials", self.__tenant_hash))
             logger.log(
                 LogLevel.INFO,
                 "TenantService",
@@ -110,39 +121,40 @@ class TenantService:
         )
         return doc[0] if doc else None
 
+    def _load_credentials(self):
+        """(app id, app secret) as utf-8 bytes from one info read, None if not set"""
+        info = self._getTenantInfo()
+        if not info or "cid" not in info or "csecret" not in info:
+            return None
+        try:
+            return (
+                self.__aes_cipher.decrypt(info["cid"]).encode("utf-8"),
+                self.__aes_cipher.decrypt(info["csecret"]).encode("utf-8"),
+            )
+        except Exception as e:
+            logger.log(LogLevel.ERROR, "TenantService", f"decrypt credentials failed: {e}")
+            raise
+
+    def getTenantCredentials(self):
+        """return
+        1. (app id, app secret) strings (already decrypted)
+        2. (None, None), if not exist"""
+        credentials = secret_cache.get_or_load(("credentials", self.__tenant_hash), self._load_credentials)
+        if credentials is None:
+            return None, None
+        return tuple(part.decode("utf-8") for part in credentials)
+
     def getTenantAppId(self):
         """return
         1. app id string (already decrypted)
         2. None, if not exist"""
-        info = self._getTenantInfo()
-
-        if info and "cid" in info:
-            try:
-                return self.__aes_cipher.decrypt(info["cid"])
-            except Exception as e:
-                logger.log(
-                    LogLevel.ERROR, "TenantService", f"decrypt app id failed: {e}"
-                )
-                raise
-
-        return None
+        return self.getTenantCredentials()[0]
 
     def getTenantAppSecret(self):
         """return
         1. app secret string (already decrypted)
         2. None, if not exist"""
-        info = self._getTenantInfo()
-
-        if info and "csecret" in info:
-            try:
-                return self.__aes_cipher.decrypt(info["csecret"])
-            except Exception as e:
-                logger.log(
-                    LogLevel.ERROR, "TenantService", f"decrypt app secret failed: {e}"
-                )
-                raise
-
-        return None
+        return self.getTenantCredentials()[1]
 
     def getTenantUser(self, user_id=None):
         """if user_id in None return all users"""
@@ -159,6 +171,34 @@ class TenantService:
 
         return ""
 
+    def getTenantDeltaLinks(self):
+        """return {user id: delta link} of every user that has one, in one read"""
+        docs = mongo_service.read(
+            self.__tenant_hash,
+            Collection.USER,
+            {"delta_link": {"$nin": [None, ""]}},
+            projection={"_id": 0, "id": 1, "delta_link": 1},
+        )
+        return {doc["id"]: doc["delta_link"] for doc in docs}
+
+    def saveDeltaLinks(self, delta_links):
+        """store {user id: delta link} in one bulk write, users missing are created"""
+        if not delta_links:
+            return
+        mongo_service.bulk_update(
+            self.__tenant_hash,
+            Collection.USER,
+            [({"id": user_id}, {"$set": {"delta_link": link}}) for user_id, link in delta_links.items()],
+            upsert=True,
+        )
+        logger.log(
+            LogLevel.INFO,
+            "TenantService",
+            f"save delta links success",
+            name=self.__tenant_hash,
+            count=len(delta_links),
+        )
+
     def updateTenantUser(self, user_id, **kwargs):
         """example: tenantService.updateTenantUser("abc@d.com", delta_link="www")"""
         if not user_id:
@@ -169,7 +209,7 @@ class TenantService:
 
         data = {"$set": kwargs}
         mongo_service.update_one(
-            self.__tenant_hash, Collection.USER, {"user_id": user_id}, data
+            self.__tenant_hash, Collection.USER, {"id": user_id}, data
         )
         logger.log(
             LogLevel.INFO,
@@ -193,7 +233,7 @@ class TenantService:
             raise ValueError("user_id error")
 
         mongo_service.delete_one(
-            self.__tenant_hash, Collection.USER, {"user_id": user_id}
+            self.__tenant_hash, Collection.USER, {"id": user_id}
         )
         logger.log(
             LogLevel.INFO, "TenantService", f"delete user success", user_id=user_id
@@ -0,0 +1,144 @@
+"""
+OpenTelemetry tracing.
+
+    sync.tenant                  one tenant sync, `mode` delta (cron), full (resync) or onboarding
+      sync.user_page             one Graph page of users
+        sync.mailbox             delta fetch and processing of one mailbox
+          mail.process           one message
+            mail.attachments     attachment bookkeeping
+            mail.fetch_eml       EML download from Graph
+            mail.store_eml       GridFS write
+            mail.upsert_metadata mails document lookup and insert / update
+            mail.delete_superseded_emls
+    mongo <command>              every MongoDB command, under the span that issued it
+
+Graph requests are traced by the Graph SDK itself (kiota spans per request,
+retry and token acquisition). Spans follow asyncio tasks and
+asyncio.to_thread, both copy the current context.
+
+Tracing is off unless TRACING_EXPORTER is set:
+    file     finished spans as JSON lines appended to TRACE_FILE (traces.jsonl)
+    console  finished spans printed to stdout
+
+Usage:
+    from services.tracingService import record_error, span_attributes, tracer
+    with tracer.start_as_current_span("sync.tenant", attributes=span_attributes(tenant=tenant)) as span:
+        try:
+            ...
+        except Exception as e:
+            record_error(span, e)   # handled here, the span still reports the failure
+"""
+
+import os
+import threading
+
+from opentelemetry import trace
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import (
+    BatchSpanProcessor,
+    ConsoleSpanExporter,
+    SpanExporter,
+    SpanExportResult,
+)
+from opentelemetry.trace import SpanKind, Status, StatusCode
+from pymongo import monitoring
+
+TRACING_EXPORTER = os.getenv("TRACING_EXPORTER", "none")
+TRACE_FILE = os.getenv("TRACE_FILE", "traces.jsonl")
+SERVICE_NAME = "inbox-connector"
+
+
+class JsonLinesSpanExporter(SpanExporter):
+    """appends finished spans to a local file, one JSON object per line"""
+
+    def __init__(self, path: str):
+        self._path = path
+        self._lock = threading.Lock()
+        self._file = None
+
+    def export(self, spans) -> SpanExportResult:
+        lines = "".join(span.to_json(indent=None) + "\n" for span in spans)
+        try:
+            with self._lock:
+                if self._file is None:
+                    self._file = open(self._path, "a", encoding="utf-8")
+                self._file.write(lines)
+                self._file.flush()
+        except OSError:
+            return SpanExportResult.FAILURE
+        return SpanExportResult.SUCCESS
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def _setup() -> bool:
+    exporters = {
+        "file": lambda: JsonLinesSpanExporter(TRACE_FILE),
+        "console": ConsoleSpanExporter,
+    }
+    if TRACING_EXPORTER not in exporters:
+        return False
+    provider = TracerProvider(resource=Resource.create({"service.name": SERVICE_NAME}))
+    provider.add_span_processor(BatchSpanProcessor(exporters[TRACING_EXPORTER]()))
+    trace.set_tracer_provider(provider)
+    return True
+
+
+def span_attributes(**attributes) -> dict:
+    """span attributes without the None values, which OpenTelemetry rejects"""
+    return {key: value for key, value in attributes.items() if value is not None}
+
+
+def record_error(span, error) -> None:
+    """mark a span failed for an error that is handled inside it, an exception or a description"""
+    if isinstance(error, BaseException):
+        span.record_exception(error)
+    span.set_status(Status(StatusCode.ERROR, str(error)))
+
+
+class _MongoTracingListener(monitoring.CommandListener):
+    """one client span per command, parented to the span current in the calling thread"""
+
+    def __init__(self):
+        self._spans = {}
+
+    def _key(self, event):
+        return event.connection_id, event.request_id
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        span = tracer.start_span(
+            f"mongo {event.command_name}",
+            kind=SpanKind.CLIENT,
+            attributes=span_attributes(
+                **{
+                    "db.system": "mongodb",
+                    "db.name": event.database_name,
+                    "db.operation": event.command_name,
+                    "db.mongodb.collection": collection if isinstance(collection, str) else None,
+                }
+            ),
+        )
+        self._spans[self._key(event)] = span
+
+    def succeeded(self, event):
+        span = self._spans.pop(self._key(event), None)
+        if span is not None:
+            span.end()
+
+    def failed(self, event):
+        span = self._spans.pop(self._key(event), None)
+        if span is not None:
+            span.set_status(Status(StatusCode.ERROR, str(event.failure.get("errmsg", ""))))
+            span.end()
+
+
+TRACING_ENABLED = _setup()
+tracer = trace.get_tracer("inbox_connector")
+# passed to MongoClient(event_listeners=...), no command spans when tracing is off
+mongo_listeners = [_MongoTracingListener()] if TRACING_ENABLED else []